@@ -3,7 +3,7 @@ from .models import Chat, Message, UserProfile
 
 @admin.register(Chat)
 class ChatAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'created_at']
+    list_display = ['id', 'user', 'created_at', 'last_message_at', 'message_count']
     list_filter = ['created_at']
 
 @admin.register(Message)
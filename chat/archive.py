@@ -0,0 +1,124 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import ArchivedMessage, Message, Notification, UserProfile
+from .pagination import InvalidCursor, keyset_page
+from .projections import get_sender_type, message_queryset, project_messages
+
+
+def archived_queryset():
+    return ArchivedMessage.objects.select_related('sender__userprofile')
+
+
+def project_archived_messages(rows, content_key='content'):
+    # Mention usernamelari barcha qatorlar uchun bitta query
+    mention_ids = {user_id for row in rows for user_id in row.mention_ids}
+    usernames = dict(User.objects.filter(id__in=mention_ids).values_list('id', 'username')) if mention_ids else {}
+
+    return [{
+        'id': row.id,
+        'sender': row.sender.username,
+        'sender_type': get_sender_type(row.sender),
+        content_key: row.content,
+        'timestamp': row.timestamp.isoformat(),
+        'mentions': [usernames[user_id] for user_id in row.mention_ids if user_id in usernames],
+    } for row in rows]
+
+
+def history_page(chat, limit, before=None, after=None):
+    """
+    Hot jadval (Message) dan keyset sahifa, yetmasa archive dan to'ldiriladi.
+    Archive dagi messagelar doim hot dagilardan eski, shuning uchun natija
+    `cold + hot` o'sish tartibida. Qaytadi: (cold_rows, hot_rows, has_more)
+    """
+    if before and after:
+        raise InvalidCursor('Use either before or after, not both')
+
+    hot = message_queryset().filter(chat=chat)
+    cold = archived_queryset().filter(chat=chat)
+
+    if after:
+        # archive_messages --days bilan istalgan cutoff ishlatilgan bo'lishi mumkin, shuning uchun
+        # archive doim tekshiriladi: cursor eng yangi archive qatoridan yangi bo'lsa bo'sh index range
+        cold_rows, has_more = keyset_page(cold, 'timestamp', limit, after=after)
+        if has_more:
+            return cold_rows, [], True
+        hot_rows, has_more = keyset_page(hot, 'timestamp', limit - len(cold_rows), after=after)
+        return cold_rows, hot_rows, has_more
+
+    hot_rows, has_more = keyset_page(hot, 'timestamp', limit, before=before)
+    if has_more:
+        return [], hot_rows, True
+    # Hot oyna tugadi - qolganini archive dan (limit to'lgan bo'lsa ham has_more uchun bitta probe)
+    cold_rows, has_more = keyset_page(cold, 'timestamp', limit - len(hot_rows), before=before)
+    return cold_rows, hot_rows, has_more
+
+
+def project_history(cold_rows, hot_rows, content_key='content'):
+    return project_archived_messages(cold_rows, content_key) + project_messages(hot_rows, content_key)
+
+
+def release_unread(notifications):
+    # O'qilmagan notificationlar soni profil bo'yicha, bir xil son ayiriladiganlar bitta UPDATE
+    counts = notifications.filter(is_read=False).order_by().values('user_profile_id').annotate(
+        unread=Count('id')
+    ).values_list('user_profile_id', 'unread')
+    by_count = {}
+    for profile_id, count in counts:
+        by_count.setdefault(count, []).append(profile_id)
+    for count, profile_ids in by_count.items():
+        UserProfile.objects.filter(id__in=profile_ids).update(
+            unread_notifications=Greatest(F('unread_notifications') - count, 0)
+        )
+
+
+def archive_messages(cutoff, batch_size):
+    """
+    `cutoff` dan eski messagelarni batch bilan ArchivedMessage ga ko'chiradi.
+    Har bir batch alohida transaction. Har batch dan keyin (rows, bytes) yield qiladi.
+    """
+    while True:
+        with transaction.atomic():
+            messages = list(
+                Message.objects.filter(timestamp__lt=cutoff)
+                .order_by('timestamp', 'id')
+                .only('id', 'chat_id', 'sender_id', 'content', 'timestamp')[:batch_size]
+            )
+            if not messages:
+                return
+
+            ids = [message.id for message in messages]
+            mentions = {}
+            for message_id, user_id in Message.mentions.through.objects.filter(
+                message_id__in=ids
+            ).values_list('message_id', 'user_id'):
+                mentions.setdefault(message_id, []).append(user_id)
+
+            archived = [ArchivedMessage(
+                id=message.id,
+                chat_id=message.chat_id,
+                sender_id=message.sender_id,
+                content=message.content,
+                timestamp=message.timestamp,
+                mention_ids=mentions.get(message.id, []),
+            ) for message in messages]
+            ArchivedMessage.objects.bulk_create(archived)
+
+            # Mentionlar mention_ids da qoladi, notificationlar esa o'chiriladi (o'qilmaganlari
+            # counter dan ayiriladi). Bulk DELETE, signal siz: history archive dan bir xil
+            # ko'rinadi, shuning uchun last_message marker, recent buffer va revision o'zgarmaydi
+            notifications = Notification.objects.filter(message_id__in=ids)
+            release_unread(notifications)
+            notifications._raw_delete(notifications.db)
+            Message.mentions.through.objects.filter(message_id__in=ids).delete()
+            hot = Message.objects.filter(id__in=ids)
+            hot._raw_delete(hot.db)
+
+        moved_bytes = sum(
+            len(row.content.encode()) + len(json.dumps(row.mention_ids)) for row in archived
+        )
+        yield len(archived), moved_bytes
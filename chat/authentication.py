@@ -2,11 +2,11 @@ import jwt
 from django.conf import settings
 from rest_framework import authentication, exceptions
 
+from .principals import get_principal, principal_to_user
+
 
 class JWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
-        from django.contrib.auth.models import User
-
         auth_header = request.headers.get('Authorization')
 
         if not auth_header:
@@ -24,13 +24,15 @@ class JWTAuthentication(authentication.BaseAuthentication):
             if not user_id:
                 raise exceptions.AuthenticationFailed('Invalid token')
 
-            user = User.objects.get(id=user_id)
+            principal = get_principal(user_id)
+            if principal is None:
+                raise exceptions.AuthenticationFailed('User not found')
+            if not principal.is_active:
+                raise exceptions.AuthenticationFailed('User inactive')
 
-            return (user, None)
+            return (principal_to_user(principal), None)
 
         except jwt.ExpiredSignatureError:
             raise exceptions.AuthenticationFailed('Token has expired')
         except jwt.InvalidTokenError:
-            raise exceptions.AuthenticationFailed('Invalid token')
-        except User.DoesNotExist:
-            raise exceptions.AuthenticationFailed('User not found')
\ No newline at end of file
+            raise exceptions.AuthenticationFailed('Invalid token')
\ No newline at end of file
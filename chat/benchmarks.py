@@ -0,0 +1,238 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import jwt
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from .db import database_sync_to_async
+from .middleware import JWTAuthMiddleware
+from .models import Chat, UserProfile
+from .routing import websocket_urlpatterns
+
+# Qaysi metrikada kattaroq qiymat yomon, qaysida kichikroq
+LOWER_IS_BETTER = ('_ms', 'queries')
+HIGHER_IS_BETTER = ('per_second',)
+# Millisekunddan kichik farqlar o'lchash shovqini, regressiya hisoblanmaydi
+MIN_DELTA_MS = 1.0
+
+
+class QueryCounter:
+    """
+    Barcha threadlardagi DB querylarni sanaydi (consumer DB ishi
+    database_sync_to_async threadida bajariladi).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._wrapped = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def attach(self, connection, **kwargs):
+        if id(connection) not in self._wrapped:
+            connection.execute_wrappers.append(self)
+            self._wrapped[id(connection)] = connection
+
+    def __enter__(self):
+        from django.db import connections
+
+        for connection in connections.all():
+            self.attach(connection)
+        connection_created.connect(self.attach)
+        return self
+
+    def __exit__(self, *exc):
+        connection_created.disconnect(self.attach)
+        for connection in self._wrapped.values():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self._wrapped.clear()
+
+    def take(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies):
+    return {
+        'p50_ms': round(statistics.median(latencies) * 1000, 3) if latencies else 0.0,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def create_fixtures(chats):
+    from .services import save_message
+
+    users = []
+    admin = User.objects.create_user('bench_visa', password='bench')
+    UserProfile.objects.create(user=admin, user_type='visa_admin')
+    for i in range(chats):
+        user = User.objects.create_user(f'bench_user{i}', password='bench')
+        UserProfile.objects.create(user=user, user_type='user')
+        chat = Chat.objects.create(user=user)
+        # Har bir connect da history frame bo'lishi uchun
+        save_message(chat, user, 'salom', [])
+        users.append((user, chat))
+    return admin, users
+
+
+def token_for(user):
+    return jwt.encode({'user_id': user.id}, settings.SECRET_KEY, algorithm='HS256')
+
+
+class ChatBenchmark:
+    """
+    ChatConsumer ni WebsocketCommunicator orqali yuklaydi. Har bir chatga
+    ikkita socket (masalan web va mobil) ulanadi: biri yuboradi, ikkinchisida
+    fan-out latency o'lchanadi.
+    """
+
+    def __init__(self, chats=10, messages=20, mentions=True, timeout=10):
+        self.chats = chats
+        self.messages = messages
+        self.mentions = mentions
+        self.timeout = timeout
+        self.application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def open(self, user, chat, last_seen=None):
+        """Ulanadi va (last_seen bo'lmasa) history frame ni kutadi."""
+        path = f'/ws/chat/{chat.id}/?token={token_for(user)}'
+        if last_seen is not None:
+            path += f'&last_seen={last_seen}'
+        communicator = WebsocketCommunicator(self.application, path)
+        connected, _ = await communicator.connect(timeout=self.timeout)
+        if not connected:
+            raise RuntimeError(f'Could not connect to chat {chat.id}')
+
+        history = None
+        if last_seen is None:
+            history = json.loads(await communicator.receive_from(timeout=self.timeout))
+        return communicator, history
+
+    async def run_chat(self, admin, sender, listener, receive_latencies, fanout_latencies):
+        for i in range(self.messages):
+            payload = {'message': f'benchmark message {i}'}
+            if self.mentions and i % 5 == 0:
+                payload['mentions'] = [admin.username]
+
+            started = time.perf_counter()
+            await sender.send_to(text_data=json.dumps(payload))
+            await sender.receive_from(timeout=self.timeout)
+            receive_latencies.append(time.perf_counter() - started)
+            await listener.receive_from(timeout=self.timeout)
+            fanout_latencies.append(time.perf_counter() - started)
+
+    async def measure_connect(self, users, counter, last_ids=None):
+        latencies, newest = [], []
+        counter.take()
+        for index, (user, chat) in enumerate(users):
+            started = time.perf_counter()
+            communicator, history = await self.open(user, chat, last_ids[index] if last_ids else None)
+            latencies.append(time.perf_counter() - started)
+            if history:
+                newest.append(history['messages'][-1]['id'])
+            await communicator.disconnect()
+        return dict(summarize(latencies), queries=counter.take() / len(users)), newest
+
+    async def measure_history(self, users, counter):
+        from .history import get_missed_messages
+
+        latencies = []
+        counter.take()
+        for _, chat in users:
+            started = time.perf_counter()
+            await database_sync_to_async(get_missed_messages)(chat, None, settings.CHAT_HISTORY_LIMIT)
+            latencies.append(time.perf_counter() - started)
+        return dict(summarize(latencies), queries=counter.take() / len(users))
+
+    async def run_async(self, admin, users):
+        results = {}
+        with QueryCounter() as counter:
+            sockets = await asyncio.gather(*[self.open(user, chat) for user, chat in users])
+            sockets += await asyncio.gather(*[self.open(user, chat) for user, chat in users])
+            senders, listeners = sockets[:len(users)], sockets[len(users):]
+
+            receive_latencies, fanout_latencies = [], []
+            counter.take()
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                self.run_chat(admin, sender, listener, receive_latencies, fanout_latencies)
+                for (sender, _), (listener, _) in zip(senders, listeners)
+            ])
+            elapsed = time.perf_counter() - started
+            total = len(users) * self.messages
+            results['receive'] = dict(
+                summarize(receive_latencies),
+                messages_per_second=round(total / elapsed, 2),
+                queries=counter.take() / total,
+            )
+            results['fanout'] = summarize(fanout_latencies)
+            for communicator, _ in sockets:
+                await communicator.disconnect()
+
+            results['connect'], last_ids = await self.measure_connect(users, counter)
+            results['send_previous_messages'] = await self.measure_history(users, counter)
+            results['resume'], _ = await self.measure_connect(users, counter, last_ids)
+        return results
+
+    def run(self):
+        admin, users = create_fixtures(self.chats)
+        # Benchmark ataylab limitdan tez yuboradi
+        with override_settings(CHAT_INBOUND_USER_RATE=0, CHAT_INBOUND_CHAT_RATE=0):
+            results = asyncio.run(self.run_async(admin, users))
+        results['meta'] = {
+            'chats': self.chats,
+            'messages_per_chat': self.messages,
+            'database': settings.DATABASES['default']['ENGINE'],
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+            'write_behind': settings.CHAT_WRITE_BEHIND,
+        }
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Baseline bilan solishtirish. Query soni qat'iy (oshmasligi kerak),
+    vaqt va throughput esa `tolerance` ulushida (vaqt kamida MIN_DELTA_MS) farq qilishi mumkin.
+    """
+    regressions = []
+    for operation, metrics in baseline.items():
+        if operation == 'meta' or operation not in results:
+            continue
+        for name, expected in metrics.items():
+            actual = results[operation].get(name)
+            if actual is None:
+                continue
+            if name == 'queries':
+                failed = actual > expected
+            elif name.endswith(LOWER_IS_BETTER):
+                failed = actual > max(expected * (1 + tolerance), expected + MIN_DELTA_MS)
+            elif name.endswith(HIGHER_IS_BETTER):
+                failed = actual < expected * (1 - tolerance)
+            else:
+                continue
+            if failed:
+                regressions.append(f'{operation}.{name}: {actual} (baseline {expected})')
+    return regressions
@@ -0,0 +1,69 @@
+import hashlib
+
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .history import chat_revision
+from .models import Notification, UserProfile
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def _opaque(etag):
+    # If-None-Match uchun weak comparison
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return etags == ['*'] or _opaque(etag) in {_opaque(tag) for tag in etags}
+
+
+def with_etag(response, etag):
+    response['ETag'] = etag
+    # Javob userga xos, client har safar If-None-Match bilan tekshiradi
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def not_modified(request, etag):
+    """If-None-Match mos kelsa bo'sh 304 javob, aks holda None."""
+    if etag_matches(request, etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def query_part(request):
+    return sorted(request.query_params.items())
+
+
+def chat_messages_etag(request, chat_id, marker):
+    """Oxirgi message (last_message marker) + o'chirishlar revision i + sahifa parametrlari."""
+    return make_etag('messages', chat_id, marker['id'], marker['timestamp'], chat_revision(chat_id), query_part(request))
+
+
+def notification_watermark(user):
+    """
+    (profile id, unread counter, eng yangi o'qilmagan notification id) bitta query da,
+    watermark chat_notif_unread_idx partial index dan. Notification id lar o'sib boradi
+    va o'qilgan qayta o'qilmagan bo'lmaydi, shuning uchun bu juftlik ro'yxatni belgilaydi.
+    """
+    newest_unread = Notification.objects.filter(
+        user_profile=OuterRef('pk'), is_read=False
+    ).order_by('-id').values('id')[:1]
+    return UserProfile.objects.filter(user=user).annotate(
+        watermark=Subquery(newest_unread)
+    ).values_list('id', 'unread_notifications', 'watermark').first()
+
+
+def notifications_etag(request, profile_id, unread, watermark):
+    return make_etag('notifications', profile_id, unread, watermark, query_part(request))
@@ -1,213 +1,238 @@
-import json
-import jwt
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.conf import settings
+from django.utils import timezone
+
+from . import encoding, metrics
+from .db import connect_rejected, database_sync_to_async, db_executor
+from .flow import OutboundQueue, inbound_limiter
+from .history import get_missed_messages, is_up_to_date, marker_id, parse_last_seen
+from .principals import get_cached_principal, get_principal, principal_cache, principal_from_user
+from .recent import recent_messages
+from .routers import replica_reads
+from .writebehind import message_ids, write_buffer
+
+logger = logging.getLogger(__name__)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    @metrics.instrument('connect')
     async def connect(self):
         try:
-            from django.contrib.auth.models import User
-            from .models import Chat, UserProfile
-
-            query_params = self.scope['query_string'].decode()
-            token = None
-            for param in query_params.split('&'):
-                if param.startswith('token='):
-                    token = param.split('=')[1]
-                    break
-
-            if not token:
-                await self.close()
-                return
-            try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                user_id = payload.get('user_id')
-            except jwt.InvalidTokenError:
+            user_id = self.scope.get('user_id')
+            if not user_id:
                 await self.close()
                 return
 
-            self.user = await self.get_user(user_id)
-            if not self.user:
+            # DB pool to'lgan bo'lsa yangi connect navbatni yanada uzaytirmaydi, client keyinroq qayta ulanadi
+            if db_executor.saturated():
+                connect_rejected.inc(consumer='ChatConsumer')
                 await self.close()
                 return
 
             self.chat_id = self.scope['url_route']['kwargs']['chat_id']
 
-            self.chat = await self.get_chat(self.chat_id)
+            # user, profil va chat bitta query, bitta thread hop
+            self.chat = await self.get_chat_for_user(user_id, self.chat_id)
             if not self.chat:
                 await self.close()
                 return
 
-            if not await self.has_access_to_chat():
-                await self.close()
-                return
+            self.user = self.chat.user
+            principal_cache.put(principal_from_user(self.user))
 
             self.room_group_name = f'chat_{self.chat_id}'
+            self.outbound = OutboundQueue(self.send, self.close, 'ChatConsumer')
 
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name)
+            # group_discard bilan juft (disconnect da kamayadi)
+            metrics.connection_opened('ChatConsumer', self.room_group_name)
 
             await self.accept()
-            print(f"WebSocket connected: {self.user.username} chat {self.chat_id}")
+            logger.info("WebSocket connected: %s chat %s", self.user.username, self.chat_id)
 
-            previous_messages = await self.send_previous_messages()
-            for message in previous_messages:
-                await self.send(text_data=json.dumps(message))
+            # Reconnectda faqat o'tkazib yuborilgan messagelar, bitta frame bilan
+            query_params = parse_qs(self.scope['query_string'].decode())
+            last_seen = parse_last_seen(query_params.get('last_seen', [None])[0])
+            if is_up_to_date(self.chat_id, last_seen):
+                return
 
-        except Exception as e:
-            print(f"Connection error: {e}")
+            history = await self.send_previous_messages(last_seen)
+            if history['messages']:
+                await self.send(text_data=encoding.dumps(history))
+
+        except Exception:
+            logger.exception("Connection error")
+            metrics.ws_event_errors.inc(consumer='ChatConsumer', event='connect')
             await self.close()
 
+    @metrics.instrument('disconnect')
     async def disconnect(self, close_code):
+        if hasattr(self, 'outbound'):
+            self.outbound.stop()
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            metrics.connection_closed('ChatConsumer', self.room_group_name)
 
+    @metrics.instrument('receive')
     async def receive(self, text_data):
-        try:
-            from .models import Message, Notification
+        # save_message dan oldin: limitdan oshgan message DB ga yetib bormaydi
+        limited = inbound_limiter.check(self.user.id, self.chat_id)
+        if limited:
+            scope, retry_after = limited
+            await self.send(text_data=encoding.dumps({
+                'error': 'Rate limit exceeded',
+                'scope': scope,
+                'retry_after': round(retry_after, 2),
+            }))
+            return
 
-            text_data_json = json.loads(text_data)
+        try:
+            text_data_json = encoding.loads(text_data)
             message_text = text_data_json['message']
             mentions = text_data_json.get('mentions', [])
-
-            saved_message = await self.save_message(message_text, mentions)
-
-            # Mention qilingan userlarga notification create qlish
-            await self.create_notifications(saved_message, mentions)
-
+            # Recent buffer faqat shu message dan oldingi holatga mos bo'lsa to'ldiriladi
+            previous_id = marker_id(self.chat_id)
+
+            if settings.CHAT_WRITE_BEHIND:
+                saved_message = await self.buffer_message(message_text, mentions)
+            else:
+                # Message, mentionlar va notificationlar bitta transaction, bitta thread hop
+                saved_message = await self.save_message(message_text, mentions)
+
+            payload = {
+                'id': saved_message.id,
+                'message': message_text,
+                'sender': self.user.username,
+                'sender_type': await self.get_user_type(self.user),
+                'timestamp': saved_message.timestamp.isoformat(),
+                'mentions': mentions
+            }
+            # Frame bir marta encode qilinadi, har bir recipient uni o'zgartirmasdan yuboradi
+            frame = encoding.dumps(payload)
+            recent_messages.append(self.chat_id, payload, saved_message.timestamp, len(frame), previous_id)
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message_text,
-                    'sender': self.user.username,
-                    'sender_type': await self.get_user_type(self.user),
-                    'timestamp': saved_message.timestamp.isoformat(),
-                    'mentions': mentions
-                }
+                {'type': 'chat_message', 'id': saved_message.id, 'frame': frame}
             )
 
+            if settings.CHAT_WRITE_BEHIND:
+                await write_buffer.put(saved_message, mentions)
+
         except Exception as e:
-            print(f"Receive error: {e}")
-            await self.send(text_data=json.dumps({
+            logger.exception("Receive error")
+            metrics.ws_event_errors.inc(consumer='ChatConsumer', event='receive')
+            await self.send(text_data=encoding.dumps({
                 'error': 'Xatolik yuz berdi',
                 'details': str(e)
             }))
 
+    @metrics.instrument('chat_message')
     async def chat_message(self, event):
         try:
-            await self.send(text_data=json.dumps({'message': event['message'], 'sender': event['sender'], 'sender_type': event['sender_type'],
-                'timestamp': event['timestamp'],
-                'mentions': event['mentions']
-            }))
-        except Exception as e:
-            print(f"Chat message error: {e}")
+            # Sekin client handler ni to'xtatmaydi, navbat to'lsa overflow policy ishlaydi
+            await self.outbound.put(event['frame'], event.get('id'))
+        except Exception:
+            logger.exception("Chat message error")
+            metrics.ws_event_errors.inc(consumer='ChatConsumer', event='chat_message')
+
+    async def get_user_type(self, user):
+        # Odatda cache dan olinadi, miss bo'lsagina DB ga boriladi
+        principal = get_cached_principal(user.id)
+        if principal is None:
+            principal = await database_sync_to_async(get_principal)(user.id)
+        return principal.user_type if principal else 'user'
 
     @database_sync_to_async
-    def get_user(self, user_id):
-        from django.contrib.auth.models import User
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return None
+    def get_chat_for_user(self, user_id, chat_id):
+        from .models import Chat
 
-    @database_sync_to_async
-    def get_user_type(self, user):
-        from .models import UserProfile
-        try:
-            profile = UserProfile.objects.get(user=user)
-            return profile.user_type
-        except UserProfile.DoesNotExist:
-            return 'user'
+        # Faqat aktiv chat egasi ulana oladi (token o'chirilgan userda ham amal qiladi)
+        return Chat.objects.select_related('user__userprofile').filter(
+            id=chat_id, user_id=user_id, user__is_active=True
+        ).first()
 
     @database_sync_to_async
-    def get_chat(self, chat_id):
-        from .models import Chat
-        try:
-            return Chat.objects.get(id=chat_id)
-        except Chat.DoesNotExist:
-            return None
+    def save_message(self, message, mentions):
+        from .services import save_message
 
-    @database_sync_to_async
-    def has_access_to_chat(self):
-        from .models import UserProfile
-        try:
-            profile = UserProfile.objects.get(user=self.user)
-            user_type = profile.user_type
-        except UserProfile.DoesNotExist:
-            user_type = "user"
+        message_obj, _ = save_message(self.chat, self.user, message, mentions)
+        return message_obj
 
-        # Adminlar barcha chatlarga kira oladi
-        # if user_type in ['visa_admin', 'master_admin']:
-        #     return True
+    async def buffer_message(self, message, mentions):
+        from .models import Message
 
-        return self.chat.user == self.user
+        # id va timestamp serverda beriladi, insert esa keyinroq batch bilan
+        return Message(
+            id=await message_ids.next_id(),
+            chat_id=self.chat.id,
+            sender=self.user,
+            content=message,
+            timestamp=timezone.now(),
+        )
 
     @database_sync_to_async
-    def save_message(self, message, mentions):
-        from .models import Message
-        from django.contrib.auth.models import User
+    def send_previous_messages(self, last_seen=None):
+        with replica_reads(self.user.id):
+            return get_missed_messages(self.chat, last_seen, settings.CHAT_HISTORY_LIMIT)
 
-        message_obj = Message.objects.create( chat=self.chat, sender=self.user, content=message)
 
-        # mention qilingan user qo'shish
-        for username in mentions:
-            try:
-                user = User.objects.get(username=username)
-                message_obj.mentions.add(user)
-            except User.DoesNotExist:
-                pass
+class NotificationConsumer(AsyncWebsocketConsumer):
+    @metrics.instrument('connect')
+    async def connect(self):
+        try:
+            user_id = self.scope.get('user_id')
+            if not user_id:
+                await self.close()
+                return
 
-        return message_obj
+            principal = get_cached_principal(user_id)
+            if principal is None and db_executor.saturated():
+                connect_rejected.inc(consumer='NotificationConsumer')
+                await self.close()
+                return
+            if principal is None:
+                principal = await database_sync_to_async(get_principal)(user_id)
+            if principal is None or not principal.is_active:
+                await self.close()
+                return
 
-    @database_sync_to_async
-    def create_notifications(self, message, mentions):
-        from .models import Notification, UserProfile
-        from django.contrib.auth.models import User
-
-        for username in mentions:
-            try:
-                user = User.objects.get(username=username)
-                user_profile = UserProfile.objects.get(user=user)
-
-                Notification.objects.create(
-                    user_profile=user_profile,
-                    message=message,
-                    chat_id=message.chat.id
-                )
-                print(f"Notification create: {username}uchun, chat: {message.chat.id}")
-            except User.DoesNotExist:
-                print(f"User topilmadi  {username}")
-
-            except Exception as e:
-                print(f"Notification : {e}")
+            self.group_name = f'user_{principal.id}'
+            self.outbound = OutboundQueue(self.send, self.close, 'NotificationConsumer')
 
-    @database_sync_to_async
-    def send_previous_messages(self):
-        from .models import Message, UserProfile
-
-        messages = Message.objects.filter(chat=self.chat).order_by('timestamp')[:50]
-
-        previous_messages = []
-        for message in messages:
-            try:
-                sender_profile = UserProfile.objects.get(user=message.sender)
-                sender_type = sender_profile.user_type
-            except UserProfile.DoesNotExist:
-                sender_type = 'user'
-
-            previous_messages.append({
-                'message': message.content,
-                'sender': message.sender.username,
-                'sender_type': sender_type,
-                'timestamp': message.timestamp.isoformat(),
-                'mentions': [user.username for user in message.mentions.all()]
-            })
-
-        return previous_messages
\ No newline at end of file
+            await self.channel_layer.group_add(
+                self.group_name,
+                self.channel_name)
+            metrics.connection_opened('NotificationConsumer', self.group_name)
+
+            await self.accept()
+
+        except Exception:
+            logger.exception("Notification connection error")
+            metrics.ws_event_errors.inc(consumer='NotificationConsumer', event='connect')
+            await self.close()
+
+    @metrics.instrument('disconnect')
+    async def disconnect(self, close_code):
+        if hasattr(self, 'outbound'):
+            self.outbound.stop()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+            metrics.connection_closed('NotificationConsumer', self.group_name)
+
+    @metrics.instrument('notification_message')
+    async def notification_message(self, event):
+        try:
+            await self.outbound.put(event['frame'])
+        except Exception:
+            logger.exception("Notification message error")
+            metrics.ws_event_errors.inc(consumer='NotificationConsumer', event='notification_message')
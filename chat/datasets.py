@@ -0,0 +1,188 @@
+import random
+import string
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .directory import bump_directory_version
+from .models import Chat, Message, Notification, UserProfile
+from .permissions import ADMIN_TYPES
+from .search import search_vector_for
+from .services import increment_unread
+
+USER_PHRASES = (
+    'Salom, kartam bloklandi', 'To\'lov o\'tmadi', 'Pul yechildi lekin kelmadi',
+    'Здравствуйте, карта не работает', 'Когда вернут деньги?', 'Hello, my card was declined',
+    'PIN kodni unutdim', 'Limitni oshirish mumkinmi?', 'Rahmat', 'Chek ilova qildim',
+    'Operation failed at the ATM', 'Пришло SMS о списании', 'Qachon hal bo\'ladi?',
+)
+ADMIN_PHRASES = (
+    'Assalomu alaykum, tekshiryapmiz', 'Karta raqamining oxirgi 4 raqamini yuboring',
+    'Tranzaksiya bank tomonidan rad etilgan', 'Пожалуйста, подождите 3 рабочих дня',
+    'Refund has been initiated', 'Karta blokdan chiqarildi', 'Boshqa savol bormi?',
+    'Мы передали запрос в банк-эмитент', 'Please confirm the transaction amount',
+)
+TAILS = ('', '', '', ' 4444', ' 12 000 so\'m', ' ID 58213', ' iltimos', ' срочно', '!', '?')
+
+
+def _salt(rng):
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(22))
+
+
+class DatasetGenerator:
+    """
+    Seed bo'yicha deterministik test dataset: userlar (profili bilan), har biriga
+    bitta chat, chatda `messages` ta message (user va adminlar), mentionlar va
+    notificationlar. Hammasi bulk_create bilan, ~batch_size messagelik batchlarda.
+
+    Bir xil seed va `end` - bir xil content, timestamp, mention va read holati
+    (id lar database holatiga bog'liq).
+    """
+
+    def __init__(self, users, messages, seed=0, admins=2, prefix='synth', password='synth123',
+                 fast_hasher=False, mention_rate=0.1, read_rate=0.8, days=180, end=None,
+                 batch_size=5000, log=None):
+        self.users = users
+        self.messages = messages
+        self.admins = admins
+        self.prefix = prefix
+        self.password = password
+        self.fast_hasher = fast_hasher
+        self.mention_rate = mention_rate
+        self.read_rate = read_rate
+        self.days = days
+        self.end = end
+        self.batch_size = batch_size
+        self.log = log or (lambda line: None)
+        self.rng = random.Random(seed)
+        # Parol salt lari alohida: --fast-hasher content ni o'zgartirmasin
+        self.password_rng = random.Random(f'{seed}-passwords')
+        self._shared_hash = None
+        self.stats = {'users': 0, 'chats': 0, 'messages': 0, 'mentions': 0, 'notifications': 0}
+
+    def password_hash(self):
+        # Tezkor rejim: hash bir marta hisoblanadi va barcha userlarga beriladi (login ishlaydi)
+        if not self.fast_hasher:
+            return make_password(self.password, salt=_salt(self.password_rng))
+        if self._shared_hash is None:
+            self._shared_hash = make_password(self.password, salt=_salt(self.password_rng))
+        return self._shared_hash
+
+    def create_users(self, names, user_types, is_staff=False):
+        users = User.objects.bulk_create([
+            User(username=name, password=self.password_hash(), is_active=True, is_staff=is_staff)
+            for name in names
+        ])
+        profiles = UserProfile.objects.bulk_create([
+            UserProfile(user=user, user_type=user_type) for user, user_type in zip(users, user_types)
+        ])
+        self.stats['users'] += len(users)
+        return list(zip(users, profiles))
+
+    def build_chat(self, owner, admins):
+        """Chat (summary bilan) va uning messagelari: [(Message, mentioned [(user, profile)])]."""
+        rng = self.rng
+        user = owner[0]
+        # Username DB da unique, shuning uchun boshqa prefix bilan qayta ishga tushirish to'qnashmaydi
+        chat = Chat(id=uuid.uuid5(uuid.NAMESPACE_OID, f'chat:{user.username}'), user=user)
+        started = self.end - timedelta(seconds=rng.uniform(0, self.days * 86400))
+        span = (self.end - started).total_seconds()
+        offsets = sorted(rng.uniform(0, span) for _ in range(self.messages))
+
+        rows = []
+        for offset in offsets:
+            from_user = rng.random() < 0.6
+            admin = rng.choice(admins)
+            sender = user if from_user else admin[0]
+            content = rng.choice(USER_PHRASES if from_user else ADMIN_PHRASES) + rng.choice(TAILS)
+            mentioned = []
+            if rng.random() < self.mention_rate:
+                # User adminni, admin chat egasini mention qiladi
+                mentioned = [admin] if from_user else [owner]
+                content = f'@{mentioned[0][0].username} {content}'
+            rows.append((Message(
+                chat=chat, sender=sender, content=content,
+                timestamp=started + timedelta(seconds=offset),
+                search_vector=search_vector_for(content),
+            ), mentioned))
+
+        if rows:
+            last = rows[-1][0]
+            chat.last_message_at = last.timestamp
+            chat.last_message_preview = last.content[:Chat.PREVIEW_LENGTH]
+            chat.last_sender = last.sender
+            chat.message_count = len(rows)
+        return chat, rows
+
+    def flush(self, rows):
+        messages = Message.objects.bulk_create([message for message, _ in rows])
+        mention_rows, notifications, unread = [], [], []
+        for message, mentioned in rows:
+            for user, profile in mentioned:
+                mention_rows.append(Message.mentions.through(message_id=message.id, user_id=user.id))
+                notification = Notification(
+                    user_profile=profile, message=message, chat_id=message.chat_id,
+                    is_read=self.rng.random() < self.read_rate,
+                )
+                notifications.append(notification)
+                if not notification.is_read:
+                    unread.append(notification)
+
+        Message.mentions.through.objects.bulk_create(mention_rows)
+        notifications = Notification.objects.bulk_create(notifications)
+        if notifications:
+            # created_at auto_now_add - message vaqtiga bitta UPDATE bilan tenglashtiriladi
+            Notification.objects.filter(id__in=[n.id for n in notifications]).update(
+                created_at=Subquery(Message.objects.filter(id=OuterRef('message_id')).values('timestamp')[:1])
+            )
+        increment_unread(unread)
+
+        self.stats['messages'] += len(messages)
+        self.stats['mentions'] += len(mention_rows)
+        self.stats['notifications'] += len(notifications)
+
+    def run(self):
+        started = time.perf_counter()
+        # Bir xil dataset uchun --end berish kerak, default - bugungi kun boshi
+        self.end = self.end or timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        admins = None
+        # Har bir batch da ~batch_size ta message
+        users_per_batch = max(1, self.batch_size // max(1, self.messages))
+        for first in range(0, self.users, users_per_batch):
+            count = min(users_per_batch, self.users - first)
+            # Userlar, chatlar va messagelar birga: xato bo'lsa batch dan hech narsa qolmaydi
+            with transaction.atomic():
+                if admins is None:
+                    # Adminlar birinchi batch bilan, u yiqilsa prefix band bo'lib qolmaydi
+                    admins = self.create_users(
+                        [f'{self.prefix}_admin{i}' for i in range(self.admins)],
+                        [ADMIN_TYPES[i % 2] for i in range(self.admins)],
+                        is_staff=True,
+                    )
+                users = self.create_users(
+                    [f'{self.prefix}_user{i}' for i in range(first, first + count)], ['user'] * count
+                )
+
+                chats, rows = [], []
+                for owner in users:
+                    chat, chat_rows = self.build_chat(owner, admins)
+                    chats.append(chat)
+                    rows.extend(chat_rows)
+                Chat.objects.bulk_create(chats)
+
+                for i in range(0, len(rows), self.batch_size):
+                    self.flush(rows[i:i + self.batch_size])
+            self.stats['chats'] += len(chats)
+            self.log(f"{self.stats['users']} users, {self.stats['messages']} messages")
+
+        # bulk_create signal yubormaydi
+        bump_directory_version()
+        self.stats['seconds'] = round(time.perf_counter() - started, 3)
+        return self.stats
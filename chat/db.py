@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+queue_wait_seconds = metrics.registry.register(metrics.Histogram(
+    'chat_db_queue_wait_seconds', 'Time consumer DB calls wait for an executor thread'))
+in_flight_calls = metrics.registry.register(metrics.Gauge(
+    'chat_db_in_flight', 'Consumer DB calls running on the executor'))
+queued_calls = metrics.registry.register(metrics.Gauge(
+    'chat_db_queued', 'Consumer DB calls waiting for an executor thread'))
+connect_rejected = metrics.registry.register(metrics.Counter(
+    'chat_ws_connect_rejected_total', 'WebSocket connects rejected because the DB executor is saturated',
+    ('consumer',)))
+
+_call_state = contextvars.ContextVar('chat_db_call_state')
+
+
+class _CallState:
+    __slots__ = ('submitted', 'started', 'loop')
+
+    def __init__(self, loop):
+        self.submitted = time.perf_counter()
+        self.started = False
+        self.loop = loop
+
+
+class DBExecutor:
+    """
+    Consumer DB ishi uchun cheklangan thread pool. Har bir thread o'z
+    connection ini CONN_MAX_AGE davomida qayta ishlatadi (health check bilan),
+    shuning uchun Postgres ga ko'pi bilan `workers` ta connection ochiladi.
+    """
+
+    def __init__(self, workers, max_queue, conn_max_age):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.conn_max_age = conn_max_age
+        self.queued = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='chat-db',
+            initializer=self._init_thread,
+        )
+
+    def _init_thread(self):
+        # ASGI HTTP requestlar har safar yangi threadda ishlaydi, u yerda persistent
+        # connection leak bo'ladi. Shuning uchun CONN_MAX_AGE faqat shu threadlar uchun
+        for alias in connections:
+            connection = connections[alias]
+            connection.settings_dict = dict(connection.settings_dict, CONN_MAX_AGE=self.conn_max_age)
+
+    def saturated(self):
+        return self.queued >= self.max_queue
+
+    def submitted(self):
+        with self._lock:
+            self.queued += 1
+
+    def started(self, state):
+        with self._lock:
+            if state.started:
+                return False
+            state.started = True
+            self.queued -= 1
+            self.in_flight += 1
+        queue_wait_seconds.observe(time.perf_counter() - state.submitted)
+        return True
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def abandoned(self, state):
+        # Navbatda turgan chaqiruv bekor qilindi (masalan client uzildi)
+        with self._lock:
+            if not state.started:
+                state.started = True
+                self.queued -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'in_flight': self.in_flight,
+            }
+
+
+class ExecutorSyncToAsync(DatabaseSyncToAsync):
+    """channels database_sync_to_async, lekin cheklangan DBExecutor da."""
+
+    def __init__(self, func, db_executor):
+        @functools.wraps(func)
+        def tracked(*args, **kwargs):
+            # Thread ichida, chaqiruvchi contextida ishlaydi
+            counted = db_executor.started(_call_state.get())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if counted:
+                    db_executor.finished()
+
+        super().__init__(tracked, thread_sensitive=False, executor=db_executor.pool)
+        self.db_executor = db_executor
+
+    async def __call__(self, *args, **kwargs):
+        state = _CallState(asyncio.get_running_loop())
+        token = _call_state.set(state)
+        self.db_executor.submitted()
+        try:
+            return await super().__call__(*args, **kwargs)
+        finally:
+            self.db_executor.abandoned(state)
+            _call_state.reset(token)
+
+
+db_executor = DBExecutor(
+    settings.CHAT_DB_EXECUTOR_WORKERS,
+    settings.CHAT_DB_EXECUTOR_MAX_QUEUE,
+    settings.CHAT_DB_CONN_MAX_AGE,
+)
+
+
+def database_sync_to_async(func):
+    return ExecutorSyncToAsync(func, db_executor)
+
+
+def calling_loop():
+    """Executor threadida - chaqiruvchi consumer ning event loopi, boshqa joyda None."""
+    state = _call_state.get(None)
+    return state.loop if state is not None else None
+
+
+def collect_executor_stats():
+    stats = db_executor.stats()
+    in_flight_calls.set(stats['in_flight'])
+    queued_calls.set(stats['queued'])
+
+
+metrics.registry.collectors.append(collect_executor_stats)
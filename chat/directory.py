@@ -0,0 +1,53 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .versions import bump_version, cached_version
+
+VERSION_KEY = 'users:directory:version'
+
+
+def directory_version():
+    return cached_version(VERSION_KEY)
+
+
+def bump_directory_version():
+    """User yoki profil o'zgardi - barcha cache dagi sahifalar eskiradi."""
+    bump_version(VERSION_KEY)
+
+
+def directory_key(prefix, limit, after):
+    digest = hashlib.sha1(f'{prefix}|{after}'.encode()).hexdigest()
+    return f'users:directory:{directory_version()}:{limit}:{digest}'
+
+
+def query_directory(prefix, limit, after=None):
+    """
+    Aktiv userlar username bo'yicha, profil JOIN bilan bitta query. `startswith`
+    (LIKE 'prefix%') Postgres da username ning varchar_pattern_ops indexidan o'qiladi.
+    """
+    users = User.objects.filter(is_active=True)
+    if prefix:
+        users = users.filter(username__startswith=prefix)
+    if after:
+        users = users.filter(username__gt=after)
+    rows = list(users.order_by('username').values_list('id', 'username', 'userprofile__user_type')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'users': [{'id': pk, 'username': username, 'user_type': user_type or 'user'}
+                  for pk, username, user_type in rows],
+        'has_more': has_more,
+        'after': rows[-1][1] if has_more else None,
+    }
+
+
+def directory_page(prefix, limit, after=None):
+    key = directory_key(prefix, limit, after)
+    page = cache.get(key)
+    if page is None:
+        page = query_directory(prefix, limit, after)
+        cache.set(key, page, timeout=settings.USER_DIRECTORY_CACHE_SECONDS)
+    return page
@@ -0,0 +1,36 @@
+import json
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # orjson ixtiyoriy, yo'q bo'lsa stdlib json
+    orjson = None
+
+USE_ORJSON = orjson is not None and settings.CHAT_JSON_BACKEND in ('auto', 'orjson')
+
+
+def dumps(data):
+    """WebSocket frame uchun JSON matn. Broadcastda bir marta chaqiriladi."""
+    if USE_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data)
+
+
+def loads(data):
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(data, default=None):
+    """
+    HTTP javob uchun UTF-8 JSON. datetime lar `default` ga beriladi,
+    shunda format DRF encoder bilan bir xil qoladi.
+    """
+    if USE_ORJSON:
+        return orjson.dumps(
+            data, default=default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(',', ':')).encode()
@@ -0,0 +1,153 @@
+import csv
+import zlib
+from collections import defaultdict
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.http import StreamingHttpResponse
+
+from . import encoding
+from .models import ArchivedMessage, Message
+
+EXPORT_FIELDS = ('id', 'chat_id', 'sender', 'sender_type', 'content', 'timestamp', 'mentions')
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+_ROW_FIELDS = ('id', 'chat_id', 'sender__username', 'sender__userprofile__user_type', 'content', 'timestamp')
+
+
+def _hot_mentions(alias, batch):
+    pairs = Message.mentions.through.objects.using(alias).filter(
+        message_id__in=[row[0] for row in batch]
+    ).values_list('message_id', 'user__username')
+    mentions = defaultdict(list)
+    for message_id, username in pairs:
+        mentions[message_id].append(username)
+    return [mentions.get(row[0], []) for row in batch]
+
+
+def _archived_mentions(alias, batch):
+    mention_ids = {user_id for row in batch for user_id in row[-1]}
+    usernames = dict(
+        User.objects.using(alias).filter(id__in=mention_ids).values_list('id', 'username')
+    ) if mention_ids else {}
+    return [[usernames[user_id] for user_id in row[-1] if user_id in usernames] for row in batch]
+
+
+def transcript_messages(alias=DEFAULT_DB_ALIAS, chat_id=None, date_from=None, date_to=None, chunk_size=None):
+    """
+    Archive va hot jadvaldagi messagelar (timestamp bo'yicha), server-side cursor
+    bilan `chunk_size` tadan o'qiladi. Xotirada bir vaqtda bitta chunk turadi,
+    mentionlar ham shu chunk uchun bitta query bilan olinadi.
+    """
+    chunk_size = chunk_size or settings.CHAT_EXPORT_CHUNK_SIZE
+    for model, extra, mentions in (
+        (ArchivedMessage, ('mention_ids',), _archived_mentions),
+        (Message, (), _hot_mentions),
+    ):
+        queryset = model.objects.using(alias).order_by('timestamp', 'id')
+        if chat_id is not None:
+            queryset = queryset.filter(chat_id=chat_id)
+        if date_from:
+            queryset = queryset.filter(timestamp__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(timestamp__lte=date_to)
+
+        rows = queryset.values_list(*_ROW_FIELDS, *extra).iterator(chunk_size=chunk_size)
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            for row, usernames in zip(batch, mentions(alias, batch)):
+                yield {
+                    'id': row[0],
+                    'chat_id': str(row[1]),
+                    'sender': row[2],
+                    'sender_type': row[3] or 'user',
+                    'content': row[4],
+                    'timestamp': row[5].isoformat(),
+                    'mentions': usernames,
+                }
+
+
+def ndjson_lines(messages):
+    for message in messages:
+        yield encoding.dumps(message) + '\n'
+
+
+class _Echo:
+    # csv.writer qatorni yozish o'rniga qaytaradi
+    def write(self, value):
+        return value
+
+
+def csv_lines(messages):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for message in messages:
+        yield writer.writerow([
+            *(message[field] for field in EXPORT_FIELDS[:-1]),
+            ','.join(message['mentions']),
+        ])
+
+
+def encode_chunks(lines, chunk_bytes=None):
+    """Qatorlarni ~chunk_bytes hajmli UTF-8 bo'laklarga yig'adi."""
+    chunk_bytes = chunk_bytes or settings.CHAT_EXPORT_BUFFER_BYTES
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def stream_async(chunks):
+    """
+    ASGI da Django sync iteratorni oxirigacha xotiraga yig'ib keyin yuboradi.
+    Shuning uchun har bir bo'lak request thread ida alohida olinadi
+    (cursor va DB connection o'sha threadda qoladi).
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Client uzilsa cursor yopiladi
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def transcript_response(output, compress=False, asgi=False, **filters):
+    content_type, extension = EXPORT_FORMATS[output]
+    lines = csv_lines if output == 'csv' else ndjson_lines
+    chunks = encode_chunks(lines(transcript_messages(**filters)))
+    filename = f"transcript-{filters.get('chat_id') or 'all'}.{extension}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        content_type, filename = 'application/gzip', filename + '.gz'
+
+    response = StreamingHttpResponse(stream_async(chunks) if asgi else chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # nginx javobni buferlamasin
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+from . import encoding, metrics
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+# 4000-4999 application uchun; client last_seen bilan qayta ulanadi
+OVERFLOW_CLOSE_CODE = 4008
+
+outbound_overflows = metrics.registry.register(metrics.Counter(
+    'chat_ws_outbound_overflow_total', 'Outbound queue overflows by policy', ('consumer', 'policy')))
+outbound_dropped = metrics.registry.register(metrics.Counter(
+    'chat_ws_outbound_dropped_frames_total', 'Frames dropped or coalesced away', ('consumer',)))
+inbound_limited = metrics.registry.register(metrics.Counter(
+    'chat_ws_inbound_limited_total', 'Inbound messages rejected by rate limit', ('scope',)))
+
+
+class TokenBuckets:
+    """
+    Key bo'yicha token bucket lar (LRU bilan cheklangan). Uzoq ishlatilmagan
+    bucket to'la bo'ladi, shuning uchun uni o'chirib yuborish xavfsiz.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key, rate, burst, now):
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def retry_after(self, key, rate, burst, now=None):
+        """0 bo'lsa hozir token bor, aks holda keyingi token gacha soniya."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens = self._refill(key, rate, burst, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens = self._refill(key, rate, burst, now)
+            if tokens < 1:
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class InboundLimiter:
+    """
+    Kiruvchi messagelar uchun user va chat bo'yicha limit (process ichida).
+    Rate 0 bo'lsa shu limit o'chirilgan. Qaytadi: None yoki (scope, retry_after).
+    """
+
+    def __init__(self):
+        self.buckets = TokenBuckets()
+
+    def _limits(self, user_id, chat_id):
+        return [
+            ('user', ('user', user_id), settings.CHAT_INBOUND_USER_RATE, settings.CHAT_INBOUND_USER_BURST),
+            ('chat', ('chat', str(chat_id)), settings.CHAT_INBOUND_CHAT_RATE, settings.CHAT_INBOUND_CHAT_BURST),
+        ]
+
+    def check(self, user_id, chat_id):
+        limits = [limit for limit in self._limits(user_id, chat_id) if limit[2] > 0]
+        now = time.monotonic()
+        # Avval hammasini tekshiramiz, shunda rad etilgan message hech bir bucket ni kamaytirmaydi
+        for scope, key, rate, burst in limits:
+            wait = self.buckets.retry_after(key, rate, burst, now)
+            if wait:
+                inbound_limited.inc(scope=scope)
+                return scope, wait
+        for scope, key, rate, burst in limits:
+            self.buckets.consume(key, rate, burst, now)
+        return None
+
+
+inbound_limiter = InboundLimiter()
+
+
+class OutboundQueue:
+    """
+    Bitta connection uchun cheklangan yuborish navbati. Handler frame ni navbatga
+    qo'yib darhol qaytadi, alohida task ularni ketma-ket `send` qiladi.
+
+    To'lib qolganda:
+      drop_oldest - eng eski frame tashlanadi
+      coalesce    - navbat bitta `resync` frame bilan almashtiriladi (client last_seen bilan oladi)
+      disconnect  - connection OVERFLOW_CLOSE_CODE bilan yopiladi
+    """
+
+    def __init__(self, send, close, consumer, maxsize=None, policy=None):
+        self.send = send
+        self.close = close
+        self.consumer = consumer
+        self.maxsize = maxsize or settings.CHAT_OUTBOUND_QUEUE_SIZE
+        self.policy = policy or settings.CHAT_OUTBOUND_OVERFLOW
+        if self.policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {self.policy}')
+        self.last_sent_id = None
+        self.closed = False
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    async def put(self, frame, message_id=None):
+        if self.closed:
+            return
+        if len(self._frames) >= self.maxsize:
+            outbound_overflows.inc(consumer=self.consumer, policy=self.policy)
+            if self.policy == 'disconnect':
+                outbound_dropped.inc(len(self._frames) + 1, consumer=self.consumer)
+                self.stop()
+                await self.close(code=OVERFLOW_CLOSE_CODE)
+                return
+            if self.policy == 'drop_oldest':
+                self._frames.popleft()
+                outbound_dropped.inc(consumer=self.consumer)
+            else:
+                outbound_dropped.inc(len(self._frames), consumer=self.consumer)
+                self._frames.clear()
+                self._frames.append((encoding.dumps({'type': 'resync', 'last_seen': self.last_sent_id}), None))
+
+        self._frames.append((frame, message_id))
+        self._ready.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._frames:
+                    frame, message_id = self._frames.popleft()
+                    await self.send(text_data=frame)
+                    if message_id is not None:
+                        self.last_sent_id = message_id
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket yopilgan - qolgan framelar kerak emas
+            logger.exception("Outbound send error")
+            self.closed = True
+            self._frames.clear()
+
+    def stop(self):
+        self.closed = True
+        self._frames.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,172 @@
+import re
+from datetime import timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import history_page, project_history
+from .models import ArchivedMessage, Message
+from .pagination import encode_cursor
+from .projections import message_queryset, project_messages
+from .recent import recent_messages
+from .routers import reading_from_replica
+from .versions import bump_version, cached_version
+
+# Query string da encode qilinmagan `+00:00` bo'shliq bo'lib keladi
+UNENCODED_OFFSET_RE = re.compile(r' (\d{2}(?::?\d{2})?)$')
+
+
+def last_message_key(chat_id):
+    return f'chat:{chat_id}:last_message'
+
+
+def user_chat_key(user_id):
+    return f'chat:user:{user_id}'
+
+
+def chat_revision_key(chat_id):
+    return f'chat:{chat_id}:revision'
+
+
+def chat_revision(chat_id):
+    # Message o'chirilganda oshadi: oxirgi message o'zgarmasa ham history o'zgargan
+    return cached_version(chat_revision_key(chat_id))
+
+
+def bump_chat_revision(chat_id):
+    bump_version(chat_revision_key(chat_id))
+
+
+def newest_marker(chat_id):
+    """Chat ning eng yangi messagei (hot, bo'lmasa archive) - (chat, timestamp, id) index dan."""
+    for model in (Message, ArchivedMessage):
+        newest = model.objects.filter(chat_id=chat_id).order_by('-timestamp', '-id').values('id', 'timestamp').first()
+        if newest:
+            return {'id': newest['id'], 'timestamp': newest['timestamp'].isoformat()}
+    return {'id': 0, 'timestamp': None}
+
+
+def current_marker(chat_id):
+    """Cache dagi last_message marker, yo'q bo'lsa DB dan (primary dan o'qilgan bo'lsa cache isitiladi)."""
+    marker = cache.get(last_message_key(chat_id))
+    if marker is None:
+        marker = newest_marker(chat_id)
+        if not reading_from_replica():
+            cache.add(last_message_key(chat_id), marker, timeout=None)
+    return marker
+
+
+def marker_id(chat_id):
+    """Cache dagi last_message marker id si (yo'q bo'lsa None), DB ga murojaatsiz."""
+    marker = cache.get(last_message_key(chat_id))
+    return marker['id'] if marker else None
+
+
+def remember_last_message(message):
+    """
+    Marker faqat oldinga suriladi: ikkita save tartibsiz tugasa eski message
+    yangisining ustiga yozilmaydi.
+    """
+    key = last_message_key(message.chat_id)
+    marker = {'id': message.id, 'timestamp': message.timestamp.isoformat()}
+    if cache.add(key, marker, timeout=None):
+        return
+    current = cache.get(key)
+    if current is None or current['id'] < message.id:
+        cache.set(key, marker, timeout=None)
+
+
+def parse_last_seen(value):
+    """
+    `last_seen` message id yoki ISO timestamp bo'lishi mumkin. Timezone siz
+    timestamp UTC deb olinadi. Tushunarsiz qiymat None qaytaradi (to'liq history yuboriladi).
+    """
+    if not value:
+        return None
+    if value.isdigit():
+        return 'id', int(value)
+    timestamp = parse_datetime(UNENCODED_OFFSET_RE.sub(r'+\1', value))
+    if timestamp is None:
+        return None
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    return 'timestamp', timestamp
+
+
+def is_up_to_date(chat_id, last_seen):
+    """
+    Cache dagi oxirgi message bilan solishtiradi, DB ga murojaat qilmaydi.
+    Cache bo'sh bo'lsa None qaytadi - unda DB dan tekshirish kerak.
+    """
+    marker = cache.get(last_message_key(chat_id))
+    if marker is None or last_seen is None:
+        return None
+
+    kind, value = last_seen
+    if kind == 'id':
+        return value >= marker['id']
+    if marker['timestamp'] is None:
+        return True
+    return value >= parse_datetime(marker['timestamp'])
+
+
+def load_recent_messages(chat, revision):
+    """
+    Chat ning eng yangi messagelarini DB dan o'qib recent buffer ni isitadi.
+    `revision` o'qishdan oldin olinadi: orada message o'chirilsa buffer keyingi get da eskiradi.
+    """
+    cold_rows, hot_rows, has_more = history_page(chat, recent_messages.length)
+    rows = cold_rows + hot_rows
+    newest = rows[-1] if rows else None
+
+    if not reading_from_replica():
+        # Cache ni isitish: keyingi reconnectlar DB ga tushmaydi (replica lag qilgan bo'lishi mumkin, undan emas)
+        cache.add(last_message_key(chat.id), {
+            'id': newest.id if newest else 0,
+            'timestamp': newest.timestamp.isoformat() if newest else None,
+        }, timeout=None)
+
+    return recent_messages.put(
+        chat.id, project_history(cold_rows, hot_rows, content_key='message'), has_more, revision
+    )
+
+
+def get_missed_messages(chat, last_seen, limit):
+    """
+    `last_seen` dan keyingi eng yangi `limit` ta message (o'sish tartibida).
+    `has_more` True bo'lsa orada uzilish bor, client uni REST `before` cursor bilan oladi.
+    Odatda recent buffer dan, faqat buffer eskirgan yoki oraliq undan uzun bo'lsa DB dan.
+    """
+    revision = chat_revision(chat.id)
+    recent = recent_messages.get(chat.id, cache.get(last_message_key(chat.id)), revision)
+    if recent is None:
+        recent = load_recent_messages(chat, revision)
+
+    page = recent.page(last_seen, limit)
+    if page is not None:
+        messages, has_more, oldest = page
+        return {
+            'type': 'history',
+            'messages': messages,
+            'has_more': has_more,
+            'before': encode_cursor(oldest[1], oldest[0]['id']) if oldest else None,
+        }
+
+    queryset = message_queryset().filter(chat=chat)
+    if last_seen[0] == 'id':
+        queryset = queryset.filter(id__gt=last_seen[1]).order_by('-id')
+    else:
+        queryset = queryset.filter(timestamp__gt=last_seen[1]).order_by('-timestamp', '-id')
+
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+
+    return {
+        'type': 'history',
+        'messages': project_messages(messages, content_key='message'),
+        'has_more': has_more,
+        'before': encode_cursor(messages[0].timestamp, messages[0].id) if messages else None,
+    }
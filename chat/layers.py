@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from channels_redis.core import RedisChannelLayer
+
+from . import metrics
+
+local_deliveries = metrics.registry.register(metrics.Counter(
+    'chat_layer_local_deliveries_total', 'Group messages delivered in process memory'))
+remote_deliveries = metrics.registry.register(metrics.Counter(
+    'chat_layer_remote_deliveries_total', 'Group messages sent through Redis to other processes'))
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer bilan bir xil API. Group a'zolari shu processda bo'lsa
+    message to'g'ridan-to'g'ri ularning receive buffer iga qo'yiladi, Redis
+    orqali faqat boshqa processlardagi a'zolarga yuboriladi.
+
+    Group a'zoligi Redis da ham saqlanadi, shuning uchun boshqa processlar
+    odatdagidek yetkazadi.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # group -> {channel: (event loop, qo'shilgan vaqt)}
+        self.local_groups = {}
+
+    def is_local(self, channel):
+        return '!' in channel and self.non_local_name(channel).endswith(self.client_prefix + '!')
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self.is_local(channel):
+            self.local_groups.setdefault(group, {})[channel] = (asyncio.get_running_loop(), time.time())
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        members = self.local_groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.local_groups[group]
+
+    async def group_send(self, group, message):
+        assert self.require_valid_group_name(group), "Group name not valid"
+        self.deliver_local(group, message)
+        # Redis dagi ro'yxatdan lokal kanallar _map_channel_keys_to_connection da chiqarib tashlanadi
+        await super().group_send(group, message)
+
+    def deliver_local(self, group, message):
+        members = self.local_groups.get(group)
+        if not members:
+            return
+        expired_before = time.time() - self.group_expiry
+        running = asyncio.get_running_loop()
+        for channel, (loop, added) in list(members.items()):
+            if added < expired_before or loop.is_closed():
+                members.pop(channel, None)
+                continue
+            # Har bir qabul qiluvchiga alohida nusxa (Redis dagi deserialize kabi)
+            if loop is running:
+                self.receive_buffer[channel].put_nowait(dict(message))
+            else:
+                # async_to_sync (services) boshqa thread/loop dan chaqiradi
+                loop.call_soon_threadsafe(self._put_local, channel, dict(message))
+            local_deliveries.inc()
+        if not members:
+            self.local_groups.pop(group, None)
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        remote = [channel for channel in channel_names if not self.is_local(channel)]
+        if remote:
+            remote_deliveries.inc(len(remote))
+        return super()._map_channel_keys_to_connection(remote, message)
+
+    def _put_local(self, channel, message):
+        self.receive_buffer[channel].put_nowait(message)
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = "Eski messagelarni ArchivedMessage jadvaliga batch bilan ko'chirish"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total_rows = total_bytes = 0
+
+        for rows, moved_bytes in archive_messages(cutoff, options['batch_size']):
+            total_rows += rows
+            total_bytes += moved_bytes
+            self.stdout.write(f"{total_rows} messages archived ({total_bytes} bytes)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total_rows} messages older than {cutoff.isoformat()}, {total_bytes} bytes moved"
+        ))
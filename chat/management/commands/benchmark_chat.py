@@ -0,0 +1,56 @@
+import json
+
+from channels.layers import channel_layers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat.benchmarks import ChatBenchmark, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "ChatConsumer benchmark: connect, receive, fan-out, history. Alohida test "
+        "database da ishlaydi, natija JSON ga yoziladi va baseline bilan solishtiriladi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=10)
+        parser.add_argument('--messages', type=int, default=20, help="Har bir chatga yuboriladigan messagelar")
+        parser.add_argument('--output', default='bench_output.json')
+        parser.add_argument('--baseline', help="Solishtirish uchun oldingi natija (JSON)")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Vaqt/throughput uchun ruxsat etilgan farq ulushi")
+        parser.add_argument(
+            '--redis', action='store_true',
+            help="Sozlamalardagi channel layer (Redis) bilan; default - in-memory",
+        )
+
+    def handle(self, *args, **options):
+        layers = None if options['redis'] else {
+            'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+        }
+
+        # Asosiy database ga tegmaslik uchun test database yaratiladi
+        if connection.vendor == 'sqlite':
+            # In-memory SQLite threadlar orasida jadval lock beradi, fayl ishonchliroq
+            connection.settings_dict['TEST']['NAME'] = 'bench_db.sqlite3'
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(**({'CHANNEL_LAYERS': layers} if layers else {})):
+                channel_layers.backends = {}
+                results = ChatBenchmark(options['chats'], options['messages']).run()
+        finally:
+            channel_layers.backends = {}
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
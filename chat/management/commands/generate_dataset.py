@@ -0,0 +1,61 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from chat.datasets import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Scale test uchun deterministik dataset: N user (profil va chat bilan), har bir "
+        "chatda M message, mention va notificationlar. bulk_create bilan batchlarda yoziladi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--messages', type=int, default=100, help="Har bir chatdagi messagelar")
+        parser.add_argument('--admins', type=int, default=2, help="visa_admin / master_admin navbat bilan")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synth', help="Username prefiksi: <prefix>_user<i>, <prefix>_admin<i>")
+        parser.add_argument('--password', default='synth123')
+        parser.add_argument(
+            '--fast-hasher', action='store_true',
+            help="Parol hash bir marta hisoblanadi va barcha userlarga beriladi",
+        )
+        parser.add_argument('--mention-rate', type=float, default=0.1)
+        parser.add_argument('--read-rate', type=float, default=0.8, help="O'qilgan notificationlar ulushi")
+        parser.add_argument('--days', type=int, default=180, help="Messagelar shu kunlar oralig'ida")
+        parser.add_argument('--end', help="Oraliq oxiri (ISO). Default - bugungi kun boshi")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Bitta INSERT dagi messagelar")
+
+    def handle(self, *args, **options):
+        end = None
+        if options['end']:
+            end = parse_datetime(options['end'])
+            if end is None or end.tzinfo is None:
+                raise CommandError("--end must be an ISO datetime with timezone")
+
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users with prefix '{options['prefix']}_' already exist")
+
+        generator = DatasetGenerator(
+            options['users'], options['messages'],
+            seed=options['seed'],
+            admins=max(1, options['admins']),
+            prefix=options['prefix'],
+            password=options['password'],
+            fast_hasher=options['fast_hasher'],
+            mention_rate=options['mention_rate'],
+            read_rate=options['read_rate'],
+            days=options['days'],
+            end=end,
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        stats = generator.run()
+        self.stdout.write(json.dumps(stats, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['messages']} messages in {stats['chats']} chats ({stats['seconds']}s)"
+        ))
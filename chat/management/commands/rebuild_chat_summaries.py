@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Left
+
+from chat.models import ArchivedMessage, Chat, Message
+
+
+def latest(model):
+    return model.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-id')
+
+
+def preview(queryset):
+    return Subquery(queryset.annotate(preview=Left('content', Chat.PREVIEW_LENGTH)).values('preview')[:1])
+
+
+def count(model):
+    return Coalesce(Subquery(
+        model.objects.filter(chat=OuterRef('pk')).order_by().values('chat').annotate(
+            total=Count('id')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Chat summary fieldlarini (last_message_*, message_count) Message va "
+        "ArchivedMessage jadvallaridan qayta hisoblash"
+    )
+
+    def handle(self, *args, **kwargs):
+        # Archive dagi messagelar hot dagilardan eski: oxirgi message hot dan, bo'lmasa archive dan
+        hot, cold = latest(Message), latest(ArchivedMessage)
+
+        updated = Chat.objects.update(
+            last_message_at=Coalesce(
+                Subquery(hot.values('timestamp')[:1]), Subquery(cold.values('timestamp')[:1]),
+            ),
+            last_message_preview=Coalesce(preview(hot), preview(cold), Value('')),
+            last_sender_id=Coalesce(
+                Subquery(hot.values('sender_id')[:1]), Subquery(cold.values('sender_id')[:1]),
+            ),
+            message_count=count(Message) + count(ArchivedMessage),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt summaries for {updated} chats"))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = "search_vector bo'sh bo'lgan messagelarni batch bilan to'ldirish (Postgres)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING("Postgres emas - in-process index ishlatiladi, hech narsa qilinmadi"))
+            return
+
+        batch_size = options['batch_size']
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Message.objects.filter(id__gt=last_id, search_vector__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            total += Message.objects.filter(id__in=ids).update(
+                search_vector=SearchVector('content', config=settings.CHAT_SEARCH_CONFIG)
+            )
+            last_id = ids[-1]
+            self.stdout.write(f"{total} messages indexed")
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages"))
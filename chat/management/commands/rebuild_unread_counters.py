@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from chat.models import Notification, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "UserProfile.unread_notifications counterini o'qilmagan Notification "
+        "qatorlaridan qayta hisoblash (yangi ustun uchun backfill)"
+    )
+
+    def handle(self, *args, **kwargs):
+        unread = Notification.objects.filter(user_profile=OuterRef('pk'), is_read=False).order_by().values(
+            'user_profile'
+        ).annotate(total=Count('id')).values('total')
+
+        updated = UserProfile.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread counters for {updated} profiles"))
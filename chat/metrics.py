@@ -0,0 +1,309 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Bucket lar kumulyativ emas saqlanadi, render da yig'iladi
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, ('le', bound))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Scrape paytida chaqiriladi (queue depth, cache stats kabi tayyor qiymatlar uchun)
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    'chat_http_request_seconds', 'DRF view wall time', ('view', 'method', 'status')))
+http_request_queries = registry.register(Histogram(
+    'chat_http_request_queries', 'DB queries per request', ('view', 'method'), QUERY_BUCKETS))
+http_request_db_seconds = registry.register(Histogram(
+    'chat_http_request_db_seconds', 'DB time per request', ('view', 'method')))
+
+ws_event_seconds = registry.register(Histogram(
+    'chat_ws_event_seconds', 'WebSocket consumer event wall time', ('consumer', 'event')))
+ws_event_queries = registry.register(Histogram(
+    'chat_ws_event_queries', 'DB queries per WebSocket event', ('consumer', 'event'), QUERY_BUCKETS))
+ws_event_db_seconds = registry.register(Histogram(
+    'chat_ws_event_db_seconds', 'DB time per WebSocket event', ('consumer', 'event')))
+ws_event_errors = registry.register(Counter(
+    'chat_ws_event_errors_total', 'WebSocket consumer event errors', ('consumer', 'event')))
+
+ws_connections = registry.register(Gauge(
+    'chat_ws_connections', 'Open WebSocket connections in this process', ('consumer',)))
+ws_groups = registry.register(Gauge(
+    'chat_ws_groups', 'Channel layer groups with local members', ('consumer',)))
+
+write_buffer_depth = registry.register(Gauge(
+    'chat_write_buffer_depth', 'Write-behind messages waiting for flush'))
+write_buffer_flushed = registry.register(Gauge(
+    'chat_write_buffer_flushed', 'Write-behind messages flushed since start'))
+write_buffer_failed = registry.register(Gauge(
+    'chat_write_buffer_failed', 'Write-behind messages that could not be saved'))
+write_buffer_flush_seconds = registry.register(Histogram(
+    'chat_write_buffer_flush_seconds', 'Write-behind batch flush time, including one-by-one retries'))
+principal_cache_events = registry.register(Gauge(
+    'chat_principal_cache', 'Principal cache size and hit/miss/eviction totals', ('stat',)))
+
+
+def collect_runtime_stats():
+    from .principals import principal_cache
+    from .writebehind import write_buffer
+
+    buffer = write_buffer.stats()
+    write_buffer_depth.set(buffer['queue_depth'])
+    write_buffer_flushed.set(buffer['flushed'])
+    write_buffer_failed.set(buffer['failed'])
+    cache_stats = principal_cache.stats()
+    for stat in ('size', 'hits', 'misses', 'evictions'):
+        principal_cache_events.set(cache_stats[stat], stat=stat)
+
+
+registry.collectors.append(collect_runtime_stats)
+
+
+class QueryStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# database_sync_to_async contextvar larni threadga ko'chiradi, shuning uchun
+# consumer eventlari ichidagi querylar ham to'g'ri eventga yoziladi
+_current = contextvars.ContextVar('chat_query_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    connection_created.connect(install_query_recorder)
+
+
+class track:
+    """
+    Blok ichidagi querylarni sanaydi. `stats` da natija, wall time esa `seconds` da.
+    """
+
+    def __enter__(self):
+        self.stats = QueryStats()
+        self._token = _current.set(self.stats)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        _current.reset(self._token)
+
+
+def instrument(event):
+    """Consumer metodini o'lchaydi: wall time, query soni, DB vaqti va xatolar."""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            consumer = type(self).__name__
+            tracked = track()
+            try:
+                with tracked:
+                    return await method(self, *args, **kwargs)
+            except Exception:
+                ws_event_errors.inc(consumer=consumer, event=event)
+                raise
+            finally:
+                ws_event_seconds.observe(tracked.seconds, consumer=consumer, event=event)
+                ws_event_queries.observe(tracked.stats.queries, consumer=consumer, event=event)
+                ws_event_db_seconds.observe(tracked.stats.db_seconds, consumer=consumer, event=event)
+        return wrapper
+    return decorator
+
+
+def connection_opened(consumer, group):
+    ws_connections.inc(consumer=consumer)
+    with _groups_lock:
+        count = _group_members.get(group, 0)
+        _group_members[group] = count + 1
+    if count == 0:
+        ws_groups.inc(consumer=consumer)
+
+
+def connection_closed(consumer, group):
+    ws_connections.dec(consumer=consumer)
+    with _groups_lock:
+        count = _group_members.get(group, 0) - 1
+        if count <= 0:
+            _group_members.pop(group, None)
+        else:
+            _group_members[group] = count
+    if count == 0:
+        ws_groups.dec(consumer=consumer)
+
+
+_group_members = {}
+_groups_lock = threading.Lock()
+
+
+class MetricsMiddleware:
+    """Har bir HTTP request: wall time, query soni va DB vaqti (view nomi bo'yicha)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track() as tracked:
+            response = self.get_response(request)
+
+        view = getattr(request, '_metrics_view', 'unmatched')
+        if view is None:
+            return response
+        method = request.method
+        http_request_seconds.observe(tracked.seconds, view=view, method=method, status=response.status_code)
+        http_request_queries.observe(tracked.stats.queries, view=view, method=method)
+        http_request_db_seconds.observe(tracked.stats.db_seconds, view=view, method=method)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        # /metrics ning o'zi hisobga olinmaydi
+        if getattr(view_func, 'skip_metrics', False):
+            request._metrics_view = None
+        else:
+            request._metrics_view = (view_class or view_func).__name__
@@ -1,47 +1,30 @@
 import jwt
 from urllib.parse import parse_qs
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser, User
+from channels.middleware import BaseMiddleware
 from django.conf import settings
 
 
-@database_sync_to_async
-def get_user(user_id):
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
-
-
-class JWTAuthMiddleware:
-    def __init__(self, inner):
-        self.inner = inner
-
-    def __call__(self, scope):
-        return JWTAuthMiddlewareInstance(scope, self.inner)
-
+def get_token_user_id(scope):
+    # query string dagi token ni tekshirish, DB ga murojaat yo'q
+    query_string = scope.get("query_string", b"").decode()
+    token_list = parse_qs(query_string).get("token")
+    if not token_list:
+        return None
 
-class JWTAuthMiddlewareInstance:
-    def __init__(self, scope, inner):
-        self.scope = dict(scope)
-        self.inner = inner
-
-    async def __call__(self, receive, send):
-        # query string ni olish
-        query_string = self.scope.get("query_string", b"").decode()
-        query_params = parse_qs(query_string)
-        token_list = query_params.get("token")
-
-        if token_list:
-            token = token_list[0]
-            try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                user = await get_user(payload.get("user_id"))
-                self.scope["user"] = user
-            except jwt.InvalidTokenError:
-                self.scope["user"] = AnonymousUser()
-        else:
-            self.scope["user"] = AnonymousUser()
-
-        inner = self.inner(self.scope)
-        return await inner(receive, send)
+    try:
+        payload = jwt.decode(token_list[0], settings.SECRET_KEY, algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        return None
+    return payload.get("user_id")
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Token dagi user_id ni scope ga qo'yadi. User, profil va chat consumer
+    ichida bitta query bilan olinadi, shuning uchun bu yerda DB hop yo'q.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope["user_id"] = get_token_user_id(scope)
+        return await super().__call__(scope, receive, send)
@@ -1,4 +1,8 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import uuid
 
@@ -9,8 +13,21 @@ class Chat(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Admin inbox uchun summary, message saqlanganda yangilanadi (chat.services)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=200, blank=True, default='')
+    last_sender = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    message_count = models.PositiveIntegerField(default=0)
+
+    PREVIEW_LENGTH = 200
+
     class Meta:
         unique_together = ['user']
+        indexes = [
+            models.Index(fields=['last_message_at', 'id'], name='chat_chat_last_message_idx'),
+        ]
 
     def __str__(self):
         return f"Chat with {self.user.username}"
@@ -24,6 +41,8 @@ class UserProfile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     user_type = models.CharField(max_length=20, choices=USER_TYPES)
+    # Notification create/read paytida yangilanadi (chat.services)
+    unread_notifications = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.user.username} - {self.user_type}"
@@ -33,16 +52,48 @@ class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # auto_now_add emas: write-behind rejimda timestamp broadcast paytida beriladi
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     mentions = models.ManyToManyField(User, related_name='mentioned_in_messages', blank=True)
+    # Full-text search (Postgres), INSERT paytida to'ldiriladi (chat.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # keyset pagination (chat, timestamp, id) bo'yicha bitta index range scan
+            models.Index(fields=['chat', 'timestamp', 'id'], name='chat_msg_chat_ts_id_idx'),
+        ]
+        # GIN faqat Postgres da bor; SQLite (test) da in-process index ishlatiladi
+        if 'postgresql' in settings.DATABASES['default']['ENGINE']:
+            indexes.append(GinIndex(fields=['search_vector'], name='chat_msg_search_gin_idx'))
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}"
 
 
+class ArchivedMessage(models.Model):
+    """
+    Eski messagelar uchun ixcham jadval (archive_messages command). id asl Message
+    id si bilan bir xil, mentionlar M2M o'rniga user id lar ro'yxati.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archived_messages')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    mention_ids = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='chat_archmsg_chat_ts_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender_id}: {self.content[:50]}"
+
+
 class Notification(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='notifications')
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
@@ -52,6 +103,15 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # NotificationListView: user_profile + is_read, (created_at, id) keyset
+            models.Index(fields=['user_profile', 'is_read', 'created_at'], name='chat_notif_profile_read_idx'),
+            models.Index(
+                fields=['user_profile', 'id'],
+                condition=models.Q(is_read=False),
+                name='chat_notif_unread_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user_profile.user.username}"
\ No newline at end of file
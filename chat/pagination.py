@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    raw = f"{value.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), pk
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def decode_model_cursor(queryset, cursor):
+    # pk int (Message) yoki UUID (Chat) bo'lishi mumkin
+    value, pk = decode_cursor(cursor)
+    try:
+        return value, queryset.model._meta.pk.to_python(pk)
+    except ValidationError:
+        raise InvalidCursor('Invalid cursor')
+
+
+def get_page_size(value, default, maximum):
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid page size')
+    if size < 1:
+        raise InvalidCursor('Invalid page size')
+    return min(size, maximum)
+
+
+def keyset_page(queryset, field, limit, before=None, after=None):
+    """
+    (field, id) bo'yicha keyset pagination.
+
+    `before` / `after` berilmasa eng oxirgi sahifa qaytadi. Natija doim
+    o'sish tartibida, `has_more` esa so'ralgan yo'nalishda yana qator borligini bildiradi.
+    """
+    if before and after:
+        raise InvalidCursor('Use either before or after, not both')
+
+    if after:
+        value, pk = decode_model_cursor(queryset, after)
+        # field__gte index range ni chegaralaydi, OR esa faqat filter bo'lib qoladi
+        queryset = queryset.filter(
+            Q(**{f'{field}__gte': value}),
+            Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}),
+        )
+        rows = list(queryset.order_by(field, 'id')[:limit + 1])
+        has_more = len(rows) > limit
+        return rows[:limit], has_more
+
+    if before:
+        value, pk = decode_model_cursor(queryset, before)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lte': value}),
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}),
+        )
+
+    rows = list(queryset.order_by(f'-{field}', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
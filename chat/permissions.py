@@ -0,0 +1,18 @@
+from rest_framework import permissions
+
+from .principals import get_principal
+
+ADMIN_TYPES = ['visa_admin', 'master_admin']
+
+
+class IsChatAdmin(permissions.BasePermission):
+    """
+    Visa / Mastercard adminlari. user_type principal cache dan olinadi.
+    """
+    message = 'Access denied'
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        principal = get_principal(request.user.id)
+        return principal is not None and principal.user_type in ADMIN_TYPES
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+
+Principal = namedtuple('Principal', ['id', 'username', 'user_type', 'is_active'])
+
+INVALIDATION_CHANNEL = 'chat:principal-invalidate'
+
+logger = logging.getLogger(__name__)
+
+
+def principal_from_user(user):
+    from .projections import get_sender_type
+
+    return Principal(user.id, user.username, get_sender_type(user), user.is_active)
+
+
+def principal_to_user(principal):
+    """
+    DB ga murojaatsiz User instance. Qolgan fieldlar deferred, kerak bo'lsa lazy yuklanadi.
+    """
+    from django.contrib.auth.models import User
+
+    return User.from_db(
+        'default',
+        ['id', 'username', 'is_active'],
+        [principal.id, principal.username, principal.is_active],
+    )
+
+
+class PrincipalCache:
+    """
+    Process ichidagi LRU + TTL cache. Signal orqali tozalanadi; bir nechta
+    process bo'lsa Redis pub/sub orqali boshqa processlarga ham xabar beriladi.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[user_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, principal):
+        with self._lock:
+            self._data[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._data.move_to_end(principal.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL)
+
+_listener = None
+_listener_lock = threading.Lock()
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def _listen_for_invalidations():
+    global _listener
+    delay = min(1, settings.PRINCIPAL_CACHE_LISTENER_BACKOFF)
+    try:
+        while True:
+            try:
+                pubsub = _redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Uzilish paytidagi invalidationlar yo'qolgan bo'lishi mumkin
+                principal_cache.clear()
+                delay = min(1, settings.PRINCIPAL_CACHE_LISTENER_BACKOFF)
+                for message in pubsub.listen():
+                    principal_cache.invalidate(int(message['data']))
+            except Exception:
+                logger.exception("Principal invalidation listener error, resubscribing in %ss", delay)
+            time.sleep(delay)
+            delay = min(delay * 2, settings.PRINCIPAL_CACHE_LISTENER_BACKOFF)
+    finally:
+        # Thread to'xtasa keyingi get_cached_principal yangisini ishga tushiradi
+        with _listener_lock:
+            _listener = None
+
+
+def start_invalidation_listener():
+    global _listener
+    if not settings.PRINCIPAL_CACHE_REDIS_INVALIDATION or _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=_listen_for_invalidations, name='principal-invalidation', daemon=True
+            )
+            _listener.start()
+
+
+def _invalidate(user_id):
+    principal_cache.invalidate(user_id)
+    if not settings.PRINCIPAL_CACHE_REDIS_INVALIDATION:
+        return
+    try:
+        _redis_client().publish(INVALIDATION_CHANNEL, user_id)
+    except Exception:
+        # Save ni yiqitmaydi: boshqa processlarda principal TTL tugaguncha eskiroq qoladi
+        logger.exception("Principal invalidation publish failed for user %s", user_id)
+
+
+def invalidate_principal(user_id):
+    # Commit dan keyin: oldinroq tozalansa boshqa request eski qatorni qayta cache ga olishi mumkin
+    transaction.on_commit(lambda: _invalidate(user_id))
+
+
+def get_cached_principal(user_id):
+    start_invalidation_listener()
+    return principal_cache.get(user_id)
+
+
+def get_principal(user_id):
+    principal = get_cached_principal(user_id)
+    if principal is not None:
+        return principal
+
+    from django.contrib.auth.models import User
+
+    user = User.objects.select_related('userprofile').only(
+        'id', 'username', 'is_active', 'userprofile__user_type'
+    ).filter(id=user_id).first()
+    if user is None:
+        return None
+
+    principal = principal_from_user(user)
+    principal_cache.put(principal)
+    return principal
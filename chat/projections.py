@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+
+from .models import Message
+
+
+def message_queryset():
+    """
+    Sender va uning profili JOIN bilan, mentionlar esa bitta prefetch bilan keladi:
+    nechta message bo'lishidan qat'i nazar 2 ta query.
+    """
+    return Message.objects.defer('search_vector').select_related('sender__userprofile').prefetch_related(
+        Prefetch('mentions', queryset=User.objects.only('id', 'username'))
+    )
+
+
+def get_sender_type(user):
+    try:
+        return user.userprofile.user_type
+    except User.userprofile.RelatedObjectDoesNotExist:
+        return 'user'
+
+
+def project_message(message, content_key='content'):
+    return {
+        'id': message.id,
+        'sender': message.sender.username,
+        'sender_type': get_sender_type(message.sender),
+        content_key: message.content,
+        'timestamp': message.timestamp.isoformat(),
+        'mentions': [user.username for user in message.mentions.all()],
+    }
+
+
+def project_messages(messages, content_key='content'):
+    return [project_message(message, content_key) for message in messages]
+
+
+def project_notification(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message.content,
+        'sender': notification.message.sender.username,
+        'chat_id': str(notification.chat_id),
+        'timestamp': notification.created_at.isoformat(),
+    }
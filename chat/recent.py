@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from . import encoding, metrics
+
+cache_requests = metrics.registry.register(metrics.Counter(
+    'chat_recent_cache_requests_total', 'Connect replay lookups in the recent-message cache', ('result',)))
+cache_chats = metrics.registry.register(metrics.Gauge(
+    'chat_recent_cache_chats', 'Chats held in the recent-message cache'))
+cache_bytes = metrics.registry.register(metrics.Gauge(
+    'chat_recent_cache_bytes', 'Serialized size of the recent-message cache'))
+
+
+class RecentMessages:
+    """
+    Bitta chat ning eng yangi messagelari (o'sish tartibida), project_messages
+    formatida. `has_more_before` - bufferdan eskiroq messagelar bor,
+    `revision` - buffer qurilgandagi chat revision (message o'chirilsa oshadi).
+    """
+
+    __slots__ = ('entries', 'has_more_before', 'size', 'revision')
+
+    def __init__(self, maxlen, has_more_before=False, revision=None):
+        # (payload, timestamp, size)
+        self.entries = deque(maxlen=maxlen)
+        self.has_more_before = has_more_before
+        self.size = 0
+        self.revision = revision
+
+    @property
+    def newest_id(self):
+        return self.entries[-1][0]['id'] if self.entries else 0
+
+    def append(self, payload, timestamp, size):
+        dropped = 0
+        if len(self.entries) == self.entries.maxlen:
+            dropped = self.entries[0][2]
+            self.has_more_before = True
+        self.entries.append((payload, timestamp, size))
+        self.size += size - dropped
+        return size - dropped
+
+    def page(self, last_seen, limit):
+        """
+        (messages, has_more, oldest) yoki None - so'ralgan oraliq bufferdan tashqarida.
+        Natija get_missed_messages ning DB varianti bilan bir xil.
+        """
+        entries = list(self.entries)
+        if last_seen is None:
+            newer, complete = entries, not self.has_more_before
+        else:
+            kind, value = last_seen
+            key = (lambda entry: entry[0]['id']) if kind == 'id' else (lambda entry: entry[1])
+            newer = [entry for entry in entries if key(entry) > value]
+            # Bufferdagi eng eski message last_seen dan eski bo'lsa oraliq to'liq bufferda
+            complete = not self.has_more_before or bool(entries) and key(entries[0]) <= value
+
+        if not complete and len(newer) < limit:
+            return None
+        has_more = len(newer) > limit or not complete
+        newer = newer[-limit:]
+        return [entry[0] for entry in newer], has_more, newer[0] if newer else None
+
+
+class RecentMessageCache:
+    """
+    Process ichidagi LRU: chat -> RecentMessages. Chatlar soni va umumiy hajm
+    bo'yicha cheklangan. Har bir o'qishda bufferning oxirgi id si umumiy cache dagi
+    last_message marker bilan, revision i esa chat revision bilan solishtiriladi,
+    shuning uchun boshqa processda yozilgan yoki o'chirilgan message bo'lsa buffer
+    eskirgan hisoblanadi.
+    """
+
+    def __init__(self, maxsize, max_bytes, length):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.length = length
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, marker, revision):
+        key = str(chat_id)
+        with self._lock:
+            recent = self._data.get(key)
+            if (recent is None or marker is None or recent.newest_id != marker['id']
+                    or recent.revision != revision):
+                self.misses += 1
+                cache_requests.inc(result='miss')
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        cache_requests.inc(result='hit')
+        return recent
+
+    def put(self, chat_id, payloads, has_more_before, revision):
+        recent = RecentMessages(self.length, has_more_before, revision)
+        for payload in payloads[-self.length:]:
+            recent.append(payload, parse_datetime(payload['timestamp']), len(encoding.dumps(payload)))
+        recent.has_more_before = has_more_before or len(payloads) > self.length
+
+        key = str(chat_id)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self._data[key] = recent
+            self.size += recent.size
+            self._evict()
+        return recent
+
+    def append(self, chat_id, payload, timestamp, size, previous_id):
+        """
+        `previous_id` - save dan oldingi last_message marker id si. Buffer undan
+        orqada bo'lsa (orada boshqa process yozgan) append qilinmaydi, buffer tashlanadi.
+        """
+        # Buffer yo'q bo'lsa hech narsa qilinmaydi, keyingi connect da DB dan isitiladi
+        key = str(chat_id)
+        with self._lock:
+            recent = self._data.get(key)
+            if recent is None or payload['id'] <= recent.newest_id:
+                # Buffer save dan keyin DB dan isitilgan, message allaqachon unda
+                return
+            if recent.newest_id != previous_id:
+                del self._data[key]
+                self.size -= recent.size
+                return
+            self.size += recent.append(payload, timestamp, size)
+            self._evict()
+
+    def invalidate(self, chat_id):
+        with self._lock:
+            recent = self._data.pop(str(chat_id), None)
+            if recent is not None:
+                self.size -= recent.size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = self.hits = self.misses = 0
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.maxsize or self.size > self.max_bytes):
+            _, recent = self._data.popitem(last=False)
+            self.size -= recent.size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'chats': len(self._data),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+recent_messages = RecentMessageCache(
+    settings.CHAT_RECENT_CACHE_CHATS,
+    settings.CHAT_RECENT_CACHE_BYTES,
+    settings.CHAT_HISTORY_LIMIT,
+)
+
+
+def collect_recent_stats():
+    stats = recent_messages.stats()
+    cache_chats.set(stats['chats'])
+    cache_bytes.set(stats['bytes'])
+
+
+metrics.registry.collectors.append(collect_recent_stats)
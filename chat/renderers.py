@@ -0,0 +1,18 @@
+from rest_framework.renderers import JSONRenderer
+
+from . import encoding
+
+
+class FastJSONRenderer(JSONRenderer):
+    """orjson bo'lsa u bilan, aks holda oddiy DRF JSONRenderer."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not encoding.USE_ORJSON:
+            return super().render(data, accepted_media_type, renderer_context)
+        # ?indent= so'ralgan javoblar (browsable API) odatdagi yo'l bilan
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = encoding.dumps_bytes(data, default=self.encoder_class().default)
+        # DRF kabi: JavaScript ichida xavfli line separatorlar escape qilinadi
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,76 @@
+import contextvars
+import functools
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# replica_reads() ichida tanlangan alias, tashqarida None (primary)
+_read_alias = contextvars.ContextVar('chat_read_alias', default=None)
+
+
+def sticky_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def stick_to_primary(user_id):
+    """Yozgan user ning keyingi o'qishlari replica lag tugaguncha primary dan."""
+    if settings.CHAT_DB_REPLICAS and user_id is not None:
+        cache.set(sticky_key(user_id), 1, timeout=settings.CHAT_READ_YOUR_WRITES_SECONDS)
+
+
+def choose_read_alias(user_id):
+    replicas = settings.CHAT_DB_REPLICAS
+    if not replicas or (user_id is not None and cache.get(sticky_key(user_id))):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def replica_reads(user_id):
+    """
+    Blok ichidagi o'qishlar replica ga boradi (user yaqinda yozgan bo'lsa primary ga).
+    Stickiness blokka kirishda bir marta tekshiriladi.
+    """
+    token = _read_alias.set(choose_read_alias(user_id))
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def reading_from_replica():
+    return _read_alias.get() is not None
+
+
+def reads_from_replica(method):
+    """APIView metodlari uchun: request.user bo'yicha replica_reads."""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        with replica_reads(request.user.id):
+            return method(self, request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Faqat replica_reads() ichidagi o'qishlar replica ga yo'naltiriladi,
+    qolgan hamma narsa (va barcha yozishlar) primary da.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.CHAT_DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,157 @@
+import base64
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+from .models import Message
+from .pagination import InvalidCursor
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_for(content):
+    # INSERT ichida hisoblanadi, alohida UPDATE kerak emas
+    if not is_postgres():
+        return None
+    return SearchVector(Value(content), config=settings.CHAT_SEARCH_CONFIG)
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def encode_rank_cursor(rank, pk):
+    raw = f"{rank!r}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rank_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return float(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+class InMemorySearchIndex:
+    """
+    SQLite (dev/test) uchun process ichidagi inverted index. Birinchi qidiruvda
+    DB dan quriladi, keyin services orqali yangi messagelar qo'shib boriladi.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.docs = {}
+        self.built = False
+        self._lock = threading.Lock()
+
+    def add(self, message):
+        if not self.built:
+            return
+        with self._lock:
+            self._add(message.id, message.chat_id, message.sender_id, message.timestamp, message.content)
+
+    def _add(self, pk, chat_id, sender_id, timestamp, content):
+        tokens = tokenize(content)
+        self.docs[pk] = (chat_id, sender_id, timestamp, len(tokens) or 1)
+        for token, tf in Counter(tokens).items():
+            self.postings.setdefault(token, {})[pk] = tf
+
+    def build(self):
+        with self._lock:
+            if self.built:
+                return
+            rows = Message.objects.values_list('id', 'chat_id', 'sender_id', 'timestamp', 'content')
+            for row in rows.iterator(chunk_size=2000):
+                self._add(*row)
+            self.built = True
+
+    def clear(self):
+        with self._lock:
+            self.postings, self.docs, self.built = {}, {}, False
+
+    def search(self, text, chat_ids=None, sender_id=None, date_from=None, date_to=None):
+        """(rank, id) ro'yxati, barcha so'zlar bo'lishi shart (plainto_tsquery kabi)."""
+        self.build()
+        terms = set(tokenize(text))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self.postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates &= other.keys()
+
+            results = []
+            for pk in candidates:
+                chat_id, doc_sender, timestamp, length = self.docs[pk]
+                if chat_ids is not None and chat_id not in chat_ids:
+                    continue
+                if sender_id is not None and doc_sender != sender_id:
+                    continue
+                if date_from and timestamp < date_from:
+                    continue
+                if date_to and timestamp > date_to:
+                    continue
+                rank = sum(p[pk] for p in postings) / length
+                results.append((rank, pk))
+        return results
+
+
+memory_index = InMemorySearchIndex()
+
+
+def search_messages(queryset, text, limit, cursor=None, chat_ids=None, sender_id=None,
+                    date_from=None, date_to=None):
+    """
+    Rank bo'yicha kamayish tartibida (rank, id) keyset sahifa.
+    Qaytadi: (messages, ranks, has_more)
+    """
+    after = decode_rank_cursor(cursor) if cursor else None
+
+    if not is_postgres():
+        results = memory_index.search(text, chat_ids, sender_id, date_from, date_to)
+        results.sort(reverse=True)
+        if after:
+            results = [r for r in results if r < after]
+        page = results[:limit + 1]
+        has_more = len(page) > limit
+        page = page[:limit]
+        # O'chirilgan messagelar index da qolgan bo'lishi mumkin, in_bulk ularni tashlab yuboradi
+        rows = queryset.in_bulk([pk for _, pk in page])
+        return [rows[pk] for _, pk in page if pk in rows], [rank for rank, pk in page if pk in rows], has_more
+
+    query = SearchQuery(text, config=settings.CHAT_SEARCH_CONFIG, search_type='websearch')
+    # ts_rank real (float4) qaytaradi; cursor dagi float bilan `=` aniq ishlashi uchun float8
+    queryset = queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+    )
+    if chat_ids is not None:
+        queryset = queryset.filter(chat_id__in=chat_ids)
+    if sender_id is not None:
+        queryset = queryset.filter(sender_id=sender_id)
+    if date_from:
+        queryset = queryset.filter(timestamp__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(timestamp__lte=date_to)
+    if after:
+        rank, pk = after
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=pk))
+
+    rows = list(queryset.order_by('-rank', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, [row.rank for row in rows], has_more
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, CharField, DateTimeField, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from . import encoding
+from .db import calling_loop
+from .history import remember_last_message
+from .models import Chat, Message, Notification, UserProfile
+from .projections import project_notification
+from .routers import stick_to_primary
+from .search import memory_index, search_vector_for
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_mentions(mentions):
+    # Barcha mention qilingan userlar profili bilan bitta query da
+    if not mentions:
+        return []
+    return list(User.objects.select_related('userprofile').filter(username__in=set(mentions)))
+
+
+def build_mentions(message, users):
+    return [Message.mentions.through(message_id=message.id, user_id=user.id) for user in users]
+
+
+def build_notifications(message, users):
+    notifications = []
+    for user in users:
+        try:
+            user_profile = user.userprofile
+        except User.userprofile.RelatedObjectDoesNotExist:
+            continue
+        notifications.append(Notification(user_profile=user_profile, message=message, chat_id=message.chat_id))
+    return notifications
+
+
+async def send_notifications(frames):
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(group, {'type': 'notification.message', 'frame': frame})
+        for group, frame in frames
+    ))
+
+
+def _log_push_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Notification push error", exc_info=future.exception())
+
+
+def push_notifications(notifications):
+    # Har bir user o'zining `user_<id>` groupiga ulangan NotificationConsumer orqali oladi
+    frames = [
+        (f'user_{notification.user_profile.user_id}', encoding.dumps(project_notification(notification)))
+        for notification in notifications
+    ]
+    loop = calling_loop()
+    if loop is None:
+        # HTTP view / management command: hammasi bitta async_to_sync bilan
+        async_to_sync(send_notifications)(frames)
+        return
+    # Consumer DB threadi yuborishni kutmaydi, group_send consumer loopida ishlaydi
+    asyncio.run_coroutine_threadsafe(send_notifications(frames), loop).add_done_callback(_log_push_error)
+
+
+def increment_unread(notifications):
+    # Bir xil son qo'shiladigan profillar bitta UPDATE bilan
+    counts = {}
+    for notification in notifications:
+        counts[notification.user_profile_id] = counts.get(notification.user_profile_id, 0) + 1
+    by_count = {}
+    for profile_id, count in counts.items():
+        by_count.setdefault(count, []).append(profile_id)
+    for count, profile_ids in by_count.items():
+        UserProfile.objects.filter(id__in=profile_ids).update(
+            unread_notifications=F('unread_notifications') + count
+        )
+
+
+def create_notifications(notifications):
+    notifications = Notification.objects.bulk_create(notifications)
+    if notifications:
+        increment_unread(notifications)
+        transaction.on_commit(lambda: push_notifications(notifications))
+    return notifications
+
+
+def mark_notifications_read(user_profile, **filters):
+    """
+    O'qilmagan notificationlarni bitta UPDATE bilan o'qilgan qiladi va counterni kamaytiradi.
+    `filters`: id=..., id__lte=..., chat_id=...
+    """
+    with transaction.atomic():
+        marked = Notification.objects.filter(
+            user_profile=user_profile, is_read=False, **filters
+        ).update(is_read=True)
+        if marked:
+            UserProfile.objects.filter(id=user_profile.id).update(
+                # Counter backfill dan oldin 0 bo'lishi mumkin - manfiy bo'lmasin
+                unread_notifications=Greatest(F('unread_notifications') - marked, 0)
+            )
+    stick_to_primary(user_profile.user_id)
+    return marked
+
+
+def update_chat_summary(message, added=1):
+    # last_* faqat oldinga suriladi: tartibsiz commit yoki flush summary ni orqaga qaytarmaydi
+    newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.timestamp)
+
+    def latest(field, value, output_field):
+        return Case(When(newer, then=Value(value)), default=F(field), output_field=output_field)
+
+    Chat.objects.filter(id=message.chat_id).update(
+        last_message_at=latest('last_message_at', message.timestamp, DateTimeField()),
+        last_message_preview=latest(
+            'last_message_preview', message.content[:Chat.PREVIEW_LENGTH], CharField()
+        ),
+        last_sender_id=latest('last_sender_id', message.sender_id, IntegerField()),
+        message_count=F('message_count') + added,
+    )
+
+
+def save_message(chat, sender, content, mentions):
+    """
+    Message, mentionlar va notificationlar bitta transaction da saqlanadi.
+    Mentionlar soni qancha bo'lishidan qat'i nazar 6 ta query.
+    """
+    with transaction.atomic():
+        message = Message.objects.create(
+            chat=chat, sender=sender, content=content, search_vector=search_vector_for(content)
+        )
+        update_chat_summary(message)
+        users = resolve_mentions(mentions)
+        if users:
+            Message.mentions.through.objects.bulk_create(build_mentions(message, users))
+        notifications = create_notifications(build_notifications(message, users))
+
+    remember_last_message(message)
+    memory_index.add(message)
+    stick_to_primary(sender.id)
+    return message, notifications
+
+
+def save_messages(items):
+    """
+    Write-behind flush: `items` - (message, mentions) juftliklari, message id va
+    timestamp oldindan berilgan. Butun batch bitta transaction.
+    """
+    usernames = set()
+    for _, mentions in items:
+        usernames.update(mentions)
+
+    for message, _ in items:
+        message.search_vector = search_vector_for(message.content)
+
+    with transaction.atomic():
+        Message.objects.bulk_create([message for message, _ in items])
+        users = {user.username: user for user in resolve_mentions(usernames)}
+
+        mention_rows, notifications = [], []
+        for message, mentions in items:
+            mentioned = [users[name] for name in dict.fromkeys(mentions) if name in users]
+            mention_rows.extend(build_mentions(message, mentioned))
+            notifications.extend(build_notifications(message, mentioned))
+
+        if mention_rows:
+            Message.mentions.through.objects.bulk_create(mention_rows)
+        notifications = create_notifications(notifications)
+
+        # Har bir chat uchun bitta summary UPDATE
+        latest, added = {}, {}
+        for message, _ in items:
+            current = latest.get(message.chat_id)
+            if current is None or (current.timestamp, current.id) <= (message.timestamp, message.id):
+                latest[message.chat_id] = message
+            added[message.chat_id] = added.get(message.chat_id, 0) + 1
+        for chat_id, message in latest.items():
+            update_chat_summary(message, added[chat_id])
+
+    for message in latest.values():
+        remember_last_message(message)
+    for message, _ in items:
+        memory_index.add(message)
+    for sender_id in {message.sender_id for message, _ in items}:
+        stick_to_primary(sender_id)
+    return notifications
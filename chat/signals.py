@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .directory import bump_directory_version
+from .history import bump_chat_revision, last_message_key, user_chat_key
+from .models import Chat, Message, Notification, UserProfile
+from .principals import invalidate_principal
+from .recent import recent_messages
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.id)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_user_directory(sender, instance, update_fields=None, **kwargs):
+    # update_last_login - directory da bu field yo'q
+    if update_fields == {'last_login'}:
+        return
+    bump_directory_version()
+
+
+@receiver(post_delete, sender=Notification)
+def decrement_unread_counter(sender, instance, **kwargs):
+    # Message o'chirilganda cascade bilan ketgan o'qilmagan notificationlar
+    if not instance.is_read:
+        UserProfile.objects.filter(id=instance.user_profile_id, unread_notifications__gt=0).update(
+            unread_notifications=F('unread_notifications') - 1
+        )
+
+
+@receiver(post_delete, sender=Message)
+def invalidate_recent_messages(sender, instance, **kwargs):
+    # Boshqa processlardagi bufferlar revision (yoki o'chirilgan marker) orqali eskiradi
+    recent_messages.invalidate(instance.chat_id)
+    cache.delete(last_message_key(instance.chat_id))
+    bump_chat_revision(instance.chat_id)
+
+
+@receiver(post_delete, sender=Chat)
+def forget_user_chat(sender, instance, **kwargs):
+    cache.delete(user_chat_key(instance.user_id))
@@ -0,0 +1,1307 @@
+import asyncio
+import gzip
+import io
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import encoding, metrics, principals
+from .archive import archive_messages, history_page, project_history
+from .pagination import encode_cursor
+from .benchmarks import ChatBenchmark, compare, token_for
+from .datasets import DatasetGenerator
+from .directory import directory_page
+from .export import stream_async, transcript_messages
+from .db import DBExecutor, ExecutorSyncToAsync, connect_rejected, db_executor
+from .flow import OVERFLOW_CLOSE_CODE, InboundLimiter, OutboundQueue, TokenBuckets, inbound_limiter
+from .layers import HybridChannelLayer
+from .models import ArchivedMessage, Chat, Message, Notification, UserProfile
+from .history import (
+    bump_chat_revision, get_missed_messages, is_up_to_date, last_message_key, parse_last_seen,
+    remember_last_message,
+)
+from .principals import Principal, PrincipalCache, get_principal, principal_cache
+from .projections import message_queryset, project_messages
+from .recent import RecentMessageCache, recent_messages
+from .renderers import FastJSONRenderer
+from .routers import replica_reads, stick_to_primary
+from .search import encode_rank_cursor, memory_index, search_messages
+from .services import mark_notifications_read, save_message, save_messages
+from .writebehind import MessageIdAllocator, reserve_message_ids, write_buffer
+
+
+class MessageProjectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+
+    def create_messages(self, count):
+        for i in range(count):
+            sender = self.user if i % 2 else self.admin
+            message = Message.objects.create(chat=self.chat, sender=sender, content=f'message {i}')
+            message.mentions.add(self.admin, self.user)
+
+    def test_projection_fields(self):
+        self.create_messages(2)
+        data = project_messages(message_queryset().filter(chat=self.chat))
+
+        self.assertEqual(data[0]['sender'], 'visa')
+        self.assertEqual(data[0]['sender_type'], 'visa_admin')
+        self.assertEqual(data[1]['sender_type'], 'user')
+        self.assertEqual(data[0]['content'], 'message 0')
+        self.assertEqual(sorted(data[0]['mentions']), ['user1', 'visa'])
+
+    def test_sender_without_profile(self):
+        guest = User.objects.create_user('guest', password='guest123')
+        Message.objects.create(chat=self.chat, sender=guest, content='salom')
+
+        data = project_messages(message_queryset().filter(chat=self.chat), content_key='message')
+        self.assertEqual(data[0]['sender_type'], 'user')
+        self.assertEqual(data[0]['message'], 'salom')
+
+    def test_query_count_is_constant(self):
+        self.create_messages(5)
+        with self.assertNumQueries(2):
+            project_messages(message_queryset().filter(chat=self.chat))
+
+        self.create_messages(45)
+        with self.assertNumQueries(2):
+            data = project_messages(message_queryset().filter(chat=self.chat))
+        self.assertEqual(len(data), 50)
+
+
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        principal_cache.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        self.profile = UserProfile.objects.create(user=self.user, user_type='user')
+
+    def test_lru_eviction(self):
+        cache = PrincipalCache(maxsize=2, ttl=60)
+        for user_id in (1, 2, 3):
+            cache.put(Principal(user_id, f'u{user_id}', 'user', True))
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(3).username, 'u3')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_cached_lookup_and_signal_invalidation(self):
+        with self.assertNumQueries(1):
+            get_principal(self.user.id)
+            get_principal(self.user.id)
+        self.assertEqual(principal_cache.stats()['hits'], 1)
+
+        self.profile.user_type = 'visa_admin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+            # Commit gacha eski principal qoladi (boshqa request uni qayta cache ga olmasin)
+            self.assertEqual(get_principal(self.user.id).user_type, 'user')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_principal(self.user.id).user_type, 'visa_admin')
+
+    @override_settings(PRINCIPAL_CACHE_REDIS_INVALIDATION=True)
+    def test_publish_failure_does_not_break_save(self):
+        class Client:
+            def publish(self, channel, message):
+                raise ConnectionError('redis down')
+
+        principals._redis, principals._listener = Client(), 'thread'
+        try:
+            get_principal(self.user.id)
+            self.user.is_active = False
+            with self.assertLogs('chat.principals', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+        finally:
+            principals._redis = principals._listener = None
+        # Lokal cache baribir tozalandi
+        self.assertFalse(get_principal(self.user.id).is_active)
+
+    @override_settings(PRINCIPAL_CACHE_LISTENER_BACKOFF=0)
+    def test_invalidation_listener_resubscribes(self):
+        class Stop(BaseException):
+            pass
+
+        class PubSub:
+            def __init__(self, attempt):
+                self.attempt = attempt
+
+            def subscribe(self, channel):
+                if self.attempt == 1:
+                    raise ConnectionError('redis down')
+
+            def listen(self):
+                yield {'data': b'2'}
+                raise Stop
+
+        class Client:
+            attempts = 0
+
+            def pubsub(self, **kwargs):
+                self.attempts += 1
+                return PubSub(self.attempts)
+
+        client = Client()
+        principals._redis, principals._listener = client, 'thread'
+        principal_cache.put(Principal(1, 'u1', 'user', True))
+        try:
+            with self.assertLogs('chat.principals', 'ERROR'), self.assertRaises(Stop):
+                principals._listen_for_invalidations()
+        finally:
+            principals._redis = None
+
+        self.assertEqual(client.attempts, 2)
+        # Qayta ulanganda cache tozalanadi, listener keyingi so'rovda qayta ishga tushadi
+        self.assertIsNone(principal_cache.get(1))
+        self.assertIsNone(principals._listener)
+
+
+class SaveMessageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+
+    def test_mentions_and_notifications_in_constant_queries(self):
+        usernames = []
+        for i in range(10):
+            admin = User.objects.create_user(f'admin{i}', password='admin123')
+            UserProfile.objects.create(user=admin, user_type='visa_admin')
+            usernames.append(admin.username)
+
+        # savepoint, release + insert message, update chat summary, select users,
+        # insert mentions, insert notifications, update unread counters
+        with self.assertNumQueries(8):
+            message, notifications = save_message(self.chat, self.user, 'salom', usernames + ['unknown'])
+
+        self.assertEqual(message.mentions.count(), 10)
+        self.assertEqual(len(notifications), 10)
+        self.assertEqual(Notification.objects.filter(message=message).count(), 10)
+
+    def test_write_behind_batch_keeps_ids_and_order(self):
+        admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=admin, user_type='visa_admin')
+        ids = reserve_message_ids(3)
+        items = [
+            (Message(id=message_id, chat=self.chat, sender=self.user, content=f'message {i}'), ['visa'])
+            for i, message_id in enumerate(ids)
+        ]
+
+        save_messages(items)
+
+        self.assertEqual(list(self.chat.messages.values_list('id', flat=True)), ids)
+        self.assertEqual(Notification.objects.filter(user_profile__user=admin).count(), 3)
+
+    def test_summary_does_not_move_backwards(self):
+        message, _ = save_message(self.chat, self.user, 'yangi', [])
+        # Boshqa process dagi eskiroq flush keyin commit bo'ldi
+        older = Message(id=reserve_message_ids(1)[0], chat=self.chat, sender=self.user, content='eski',
+                        timestamp=message.timestamp - timedelta(seconds=5))
+        save_messages([(older, [])])
+
+        self.chat.refresh_from_db()
+        self.assertEqual(
+            (self.chat.last_message_at, self.chat.last_message_preview, self.chat.message_count),
+            (message.timestamp, 'yangi', 2),
+        )
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        self.profile = UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        for i in range(5):
+            save_message(self.chat, self.user, f'message {i}', ['visa'])
+
+    def unread(self):
+        self.profile.refresh_from_db()
+        return self.profile.unread_notifications
+
+    def test_counter_follows_create_and_read(self):
+        self.assertEqual(self.unread(), 5)
+
+        first = Notification.objects.filter(user_profile=self.profile).order_by('id').first()
+        self.assertEqual(mark_notifications_read(self.profile, id=first.id), 1)
+        self.assertEqual(mark_notifications_read(self.profile, id=first.id), 0)
+        self.assertEqual(self.unread(), 4)
+
+        third = Notification.objects.filter(user_profile=self.profile).order_by('id')[2]
+        self.assertEqual(mark_notifications_read(self.profile, id__lte=third.id), 2)
+        self.assertEqual(mark_notifications_read(self.profile, chat_id=self.chat.id), 2)
+        self.assertEqual(self.unread(), 0)
+
+    def test_counter_follows_cascade_delete(self):
+        Message.objects.filter(chat=self.chat).first().delete()
+        self.assertEqual(self.unread(), 4)
+
+    def test_counter_is_backfilled(self):
+        # Ustun qo'shilgandan oldingi notificationlar: counter 0, qatorlar o'qilmagan
+        UserProfile.objects.update(unread_notifications=0)
+        first = Notification.objects.filter(user_profile=self.profile).order_by('id').first()
+        self.assertEqual(mark_notifications_read(self.profile, id=first.id), 1)
+        self.assertEqual(self.unread(), 0)
+
+        call_command('rebuild_unread_counters', stdout=io.StringIO())
+        self.assertEqual(self.unread(), 4)
+        self.assertEqual(UserProfile.objects.get(user=self.user).unread_notifications, 0)
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        memory_index.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+        save_message(self.chat, self.user, 'Card blocked after payment', [])
+        save_message(self.chat, self.user, 'Card blocked, card 4444', [])
+        save_message(self.chat, self.user, 'Salom', [])
+
+    def test_ranked_keyset_pages(self):
+        first, ranks, has_more = search_messages(message_queryset(), 'card blocked', 1)
+        self.assertTrue(has_more)
+        self.assertIn('4444', first[0].content)
+
+        # Index qurilgandan keyin yangi message ham topiladi
+        save_message(self.chat, self.user, 'blocked card again', [])
+        rest, _, has_more = search_messages(
+            message_queryset(), 'card blocked', 10, cursor=encode_rank_cursor(ranks[0], first[0].id)
+        )
+        self.assertFalse(has_more)
+        self.assertEqual(len(rest), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'ts_rank faqat Postgres da')
+    def test_tied_ranks_page_without_gaps_or_repeats(self):
+        tied = [save_message(self.chat, self.user, 'Refund pending', [])[0] for _ in range(3)]
+        seen, cursor = [], None
+        while True:
+            rows, ranks, has_more = search_messages(message_queryset(), 'refund', 1, cursor=cursor)
+            seen.extend(row.id for row in rows)
+            if not has_more:
+                break
+            cursor = encode_rank_cursor(ranks[-1], rows[-1].id)
+        self.assertEqual(seen, sorted((m.id for m in tied), reverse=True))
+
+    def test_filters(self):
+        results, _, _ = search_messages(message_queryset(), 'card', 10, chat_ids=set())
+        self.assertEqual(results, [])
+        results, _, _ = search_messages(message_queryset(), 'salom', 10, sender_id=self.user.id)
+        self.assertEqual(len(results), 1)
+
+    def test_view_accepts_naive_dates(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.user)}'}
+        today = timezone.now().date()
+        response = self.client.get('/api/search/', {
+            'q': 'card', 'date_from': f'{today}T00:00:00', 'date_to': f'{today + timedelta(days=1)}T00:00:00',
+        }, **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        response = self.client.get('/api/search/', {'q': 'card', 'date_to': f'{today}T00:00:00'}, **auth)
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get('/api/search/', {'q': 'card', 'date_from': 'kecha'}, **auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        self.profile = UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        for i in range(5):
+            save_message(self.chat, self.user, f'message {i}', ['visa'])
+
+    def test_archive_and_read_through(self):
+        cutoff = Message.objects.order_by('id')[3].timestamp
+        moved = list(archive_messages(cutoff, batch_size=2))
+
+        self.assertEqual([rows for rows, _ in moved], [2, 1])
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(ArchivedMessage.objects.count(), 3)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.unread_notifications, 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Message.mentions.through.objects.count(), 2)
+
+        cold, hot, has_more = history_page(self.chat, 4)
+        data = project_history(cold, hot)
+        self.assertTrue(has_more)
+        self.assertEqual([m['content'] for m in data], ['message 1', 'message 2', 'message 3', 'message 4'])
+        self.assertEqual(data[0]['mentions'], ['visa'])
+
+    def test_forward_paging_reads_archive_newer_than_default_horizon(self):
+        # `archive_messages --days 0` kabi: settings horizon dan yangi qatorlar archive da
+        first = Message.objects.order_by('id')[0]
+        list(archive_messages(Message.objects.order_by('id')[3].timestamp, batch_size=10))
+
+        cold, hot, has_more = history_page(self.chat, 2, after=encode_cursor(first.timestamp, first.id))
+        self.assertEqual([m['content'] for m in project_history(cold, hot)], ['message 1', 'message 2'])
+        self.assertTrue(has_more)
+
+    def test_rebuild_summaries_counts_archive(self):
+        list(archive_messages(timezone.now() + timedelta(seconds=1), batch_size=10))
+        Chat.objects.update(message_count=0, last_message_at=None, last_message_preview='')
+
+        call_command('rebuild_chat_summaries', stdout=io.StringIO())
+        self.chat.refresh_from_db()
+        newest = ArchivedMessage.objects.order_by('-timestamp').first()
+        self.assertEqual(self.chat.message_count, 5)
+        self.assertEqual(
+            (self.chat.last_message_at, self.chat.last_message_preview, self.chat.last_sender_id),
+            (newest.timestamp, 'message 4', self.user.id),
+        )
+
+    def test_nothing_to_archive(self):
+        self.assertEqual(list(archive_messages(timezone.now() - timedelta(days=1), 100)), [])
+
+
+class BenchmarkTests(TransactionTestCase):
+    def test_small_run_query_budget(self):
+        results = ChatBenchmark(chats=2, messages=3).run()
+
+        # Cache dagi marker bilan resume faqat chat lookup
+        self.assertEqual(results['resume']['queries'], 1)
+        self.assertGreater(results['receive']['messages_per_second'], 0)
+        self.assertEqual(compare(results, results, tolerance=0), [])
+
+    def test_compare_flags_regressions(self):
+        baseline = {'connect': {'p95_ms': 10.0, 'queries': 2}, 'receive': {'messages_per_second': 100.0}}
+        results = {'connect': {'p95_ms': 12.0, 'queries': 3}, 'receive': {'messages_per_second': 80.0}}
+
+        self.assertEqual(compare(results, baseline, tolerance=0.25), ['connect.queries: 3 (baseline 2)'])
+        self.assertEqual(len(compare(results, baseline, tolerance=0.05)), 3)
+        # Millisekunddan kichik farq shovqin
+        self.assertEqual(compare({'connect': {'p95_ms': 0.9}}, {'connect': {'p95_ms': 0.2}}, tolerance=0), [])
+
+
+class ConsumerAccessTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+
+    def connect(self, path):
+        async def session():
+            communicator = WebsocketCommunicator(ChatBenchmark().application, path)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        return asyncio.run(session())
+
+    def test_inactive_user_cannot_join_chat(self):
+        path = f'/ws/chat/{self.chat.id}/?token={token_for(self.user)}'
+        self.assertTrue(self.connect(path))
+
+        # Token hali amal qiladi, lekin user o'chirilgan
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.connect(path))
+
+
+class NotificationConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('admin1', password='admin123')
+        self.admin_profile = UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        principal_cache.clear()
+
+    def connect(self, path):
+        async def session():
+            communicator = WebsocketCommunicator(ChatBenchmark().application, path)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        return asyncio.run(session())
+
+    def test_connect_requires_active_user(self):
+        self.assertTrue(self.connect(f'/ws/notifications/?token={token_for(self.admin)}'))
+        self.assertFalse(self.connect('/ws/notifications/'))
+        self.assertFalse(self.connect('/ws/notifications/?token=invalid'))
+
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertFalse(self.connect(f'/ws/notifications/?token={token_for(self.admin)}'))
+
+    def test_mention_is_pushed(self):
+        application = ChatBenchmark().application
+
+        async def session():
+            notifications = WebsocketCommunicator(
+                application, f'/ws/notifications/?token={token_for(self.admin)}')
+            chat = WebsocketCommunicator(application, f'/ws/chat/{self.chat.id}/?token={token_for(self.user)}')
+            self.assertTrue((await notifications.connect())[0])
+            self.assertTrue((await chat.connect())[0])
+
+            # Consumer DB threadidan (push consumer loopida)
+            await chat.send_to(text_data='{"message": "@admin1 salom", "mentions": ["admin1"]}')
+            await chat.receive_from()
+            first = encoding.loads(await notifications.receive_from())
+            # Consumer dan tashqarida (bitta async_to_sync)
+            await sync_to_async(save_message)(self.chat, self.user, 'yana', ['admin1'])
+            second = encoding.loads(await notifications.receive_from())
+
+            await chat.disconnect()
+            await notifications.disconnect()
+            return first, second
+
+        first, second = asyncio.run(session())
+        self.assertEqual((first['message'], first['sender']), ('@admin1 salom', 'user1'))
+        self.assertEqual(second['message'], 'yana')
+        self.assertEqual(Notification.objects.filter(user_profile=self.admin_profile).count(), 2)
+
+
+class MetricsTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+
+    def test_http_request_is_recorded(self):
+        before = metrics.http_request_queries.count(view='ChatView', method='GET')
+        before_ok = metrics.http_request_seconds.count(view='ChatView', method='GET', status=200)
+        response = self.client.get('/api/chat/', HTTP_AUTHORIZATION=f'Bearer {token_for(self.user)}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.http_request_queries.count(view='ChatView', method='GET'), before + 1)
+        self.assertEqual(metrics.http_request_seconds.count(view='ChatView', method='GET', status=200), before_ok + 1)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('chat_http_request_queries_bucket{view="ChatView",method="GET",le="+Inf"}', body)
+        self.assertIn('chat_write_buffer_depth 0', body)
+        # /metrics o'zi yozilmaydi
+        self.assertNotIn('view="metrics_view"', body)
+
+    def test_websocket_events_and_connections(self):
+        application = ChatBenchmark().application
+
+        async def session():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/chat/{self.chat.id}/?token={token_for(self.user)}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            open_connections = metrics.ws_connections.value(consumer='ChatConsumer')
+            await communicator.send_to(text_data='{"message": "salom"}')
+            await communicator.receive_from()
+            await communicator.disconnect()
+            return open_connections
+
+        before = metrics.ws_connections.value(consumer='ChatConsumer')
+        receives = metrics.ws_event_queries.count(consumer='ChatConsumer', event='receive')
+        self.assertEqual(asyncio.run(session()), before + 1)
+        self.assertEqual(metrics.ws_connections.value(consumer='ChatConsumer'), before)
+        self.assertEqual(metrics.ws_event_queries.count(consumer='ChatConsumer', event='receive'), receives + 1)
+
+    def test_write_buffer_flush_is_timed(self):
+        before = metrics.write_buffer_flush_seconds.count()
+        message = Message(id=reserve_message_ids(1)[0], chat=self.chat, sender=self.user,
+                          content='salom', timestamp=timezone.now())
+        write_buffer._write([(message, [])])
+
+        self.assertTrue(Message.objects.filter(id=message.id).exists())
+        self.assertEqual(metrics.write_buffer_flush_seconds.count(), before + 1)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(f'chat_write_buffer_flush_seconds_count {before + 1}', body)
+
+    def test_histogram_render(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ('op',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, op='a')
+        histogram.observe(0.5, op='a')
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{op="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{op="a",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{op="a"} 2', lines)
+
+
+class EncodingTests(TransactionTestCase):
+    def test_renderer_matches_drf_json(self):
+        from decimal import Decimal
+        from uuid import uuid4
+
+        from rest_framework.renderers import JSONRenderer
+
+        data = {'id': uuid4(), 'at': timezone.now(), 'amount': Decimal('1.50'), 'text': "o'zbek тест \u2028", 1: None}
+        self.assertEqual(
+            encoding.loads(FastJSONRenderer().render(data)),
+            encoding.loads(JSONRenderer().render(data)),
+        )
+
+    def test_broadcast_frame_is_forwarded_unchanged(self):
+        user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=user, user_type='user')
+        chat = Chat.objects.create(user=user)
+        application = ChatBenchmark().application
+        path = f'/ws/chat/{chat.id}/?token={token_for(user)}'
+
+        async def session():
+            sender, listener = WebsocketCommunicator(application, path), WebsocketCommunicator(application, path)
+            await sender.connect()
+            await listener.connect()
+            await sender.send_to(text_data='{"message": "salom", "mentions": []}')
+            frames = [await sender.receive_from(), await listener.receive_from()]
+            await sender.disconnect()
+            await listener.disconnect()
+            return frames
+
+        sent, forwarded = asyncio.run(session())
+        self.assertEqual(sent, forwarded)
+        self.assertEqual(encoding.loads(sent)['message'], 'salom')
+
+
+class FlowControlTests(TransactionTestCase):
+    def test_token_bucket_refills(self):
+        buckets = TokenBuckets()
+        self.assertTrue(buckets.consume('k', rate=1, burst=2, now=0))
+        self.assertTrue(buckets.consume('k', rate=1, burst=2, now=0))
+        self.assertFalse(buckets.consume('k', rate=1, burst=2, now=0.5))
+        self.assertAlmostEqual(buckets.retry_after('k', rate=1, burst=2, now=0.5), 0.5)
+        self.assertTrue(buckets.consume('k', rate=1, burst=2, now=1))
+
+    @override_settings(CHAT_INBOUND_USER_RATE=0.01, CHAT_INBOUND_USER_BURST=2,
+                       CHAT_INBOUND_CHAT_RATE=0.01, CHAT_INBOUND_CHAT_BURST=3)
+    def test_inbound_limiter_scopes(self):
+        limiter = InboundLimiter()
+        self.assertIsNone(limiter.check(1, 'chat-a'))
+        self.assertIsNone(limiter.check(1, 'chat-a'))
+        self.assertEqual(limiter.check(1, 'chat-a')[0], 'user')
+        # Rad etilgan message chat bucket dan token olmagan
+        self.assertIsNone(limiter.check(2, 'chat-a'))
+        self.assertEqual(limiter.check(3, 'chat-a')[0], 'chat')
+
+    def run_queue(self, policy, frames):
+        sent, closed = [], []
+        gate = asyncio.Event()
+
+        async def send(text_data):
+            await gate.wait()
+            sent.append(text_data)
+
+        async def close(code):
+            closed.append(code)
+
+        async def scenario():
+            queue = OutboundQueue(send, close, 'Test', maxsize=2, policy=policy)
+            for message_id, frame in enumerate(frames, 1):
+                await queue.put(frame, message_id)
+                await asyncio.sleep(0)
+            gate.set()
+            for _ in range(5):
+                await asyncio.sleep(0)
+            queue.stop()
+
+        asyncio.run(scenario())
+        return sent, closed
+
+    def test_outbound_drop_oldest(self):
+        # Birinchi frame send da turibdi, navbatda 2 tadan ko'p saqlanmaydi
+        sent, _ = self.run_queue('drop_oldest', ['a', 'b', 'c', 'd'])
+        self.assertEqual(sent, ['a', 'c', 'd'])
+
+    def test_outbound_coalesce(self):
+        sent, _ = self.run_queue('coalesce', ['a', 'b', 'c', 'd'])
+        self.assertEqual(sent[0], 'a')
+        self.assertEqual(encoding.loads(sent[1]), {'type': 'resync', 'last_seen': None})
+        self.assertEqual(sent[2:], ['d'])
+
+    def test_outbound_disconnect(self):
+        sent, closed = self.run_queue('disconnect', ['a', 'b', 'c', 'd'])
+        self.assertEqual(closed, [OVERFLOW_CLOSE_CODE])
+        self.assertEqual(sent, [])
+
+    @override_settings(CHAT_INBOUND_USER_RATE=0.01, CHAT_INBOUND_USER_BURST=1)
+    def test_rate_limited_message_is_not_saved(self):
+        inbound_limiter.buckets.clear()
+        user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=user, user_type='user')
+        chat = Chat.objects.create(user=user)
+
+        async def session():
+            communicator = WebsocketCommunicator(
+                ChatBenchmark().application, f'/ws/chat/{chat.id}/?token={token_for(user)}')
+            await communicator.connect()
+            await communicator.send_to(text_data='{"message": "1"}')
+            first = await communicator.receive_from()
+            await communicator.send_to(text_data='{"message": "2"}')
+            second = await communicator.receive_from()
+            await communicator.disconnect()
+            return encoding.loads(first), encoding.loads(second)
+
+        first, second = asyncio.run(session())
+        self.assertEqual(first['message'], '1')
+        self.assertEqual(second['error'], 'Rate limit exceeded')
+        self.assertEqual(Message.objects.filter(chat=chat).count(), 1)
+
+
+class HybridChannelLayerTests(TestCase):
+    def setUp(self):
+        # Konstruktor Redis ga ulanmaydi, lokal yo'l Redis siz tekshiriladi
+        self.layer = HybridChannelLayer(hosts=[('localhost', 6379)])
+
+    def test_local_members_are_delivered_in_memory(self):
+        async def scenario():
+            channel = await self.layer.new_channel()
+            self.layer.local_groups['chat_x'] = {channel: (asyncio.get_running_loop(), time.time())}
+            self.layer.deliver_local('chat_x', {'type': 'chat_message', 'frame': '{}'})
+            return await asyncio.wait_for(self.layer.receive(channel), 1)
+
+        self.assertEqual(asyncio.run(scenario()), {'type': 'chat_message', 'frame': '{}'})
+
+    def test_only_remote_channels_go_to_redis(self):
+        async def scenario():
+            return await self.layer.new_channel()
+
+        local = asyncio.run(scenario())
+        remote = 'specific.0123456789abcdef!abc'
+        connections, messages, _ = self.layer._map_channel_keys_to_connection([local, remote], {'type': 'x'})
+
+        keys = [key for keys in connections.values() for key in keys]
+        self.assertEqual(keys, [self.layer.prefix + 'specific.0123456789abcdef!'])
+        self.assertEqual(len(messages), 1)
+
+
+class MessageIdAllocatorTests(TransactionTestCase):
+    def test_concurrent_requests_share_one_reservation_without_spare_ids(self):
+        user = User.objects.create_user('user1', password='user123')
+        chat = Chat.objects.create(user=user)
+        last = Message.objects.create(chat=chat, sender=user, content='salom').id
+        allocator = MessageIdAllocator()
+
+        async def allocate():
+            first = await asyncio.gather(*(allocator.next_id() for _ in range(3)))
+            return first, await allocator.next_id()
+
+        first, second = asyncio.run(allocate())
+        self.assertEqual(first, [last + 1, last + 2, last + 3])
+        # Zaxira blok yo'q: keyingi id ham navbatdagi
+        self.assertEqual(second, last + 4)
+
+
+class DBExecutorTests(TransactionTestCase):
+    def test_queue_and_in_flight_accounting(self):
+        executor = DBExecutor(workers=1, max_queue=1, conn_max_age=60)
+        release = threading.Event()
+
+        def blocking():
+            from django.db import connection
+
+            release.wait(5)
+            return connection.settings_dict['CONN_MAX_AGE']
+
+        async def scenario():
+            call = ExecutorSyncToAsync(blocking, executor)
+            first = asyncio.ensure_future(call())
+            second = asyncio.ensure_future(call())
+            while executor.in_flight == 0:
+                await asyncio.sleep(0.01)
+            stats = executor.stats()
+            saturated = executor.saturated()
+            release.set()
+            return stats, saturated, await first, await second
+
+        stats, saturated, first, _ = asyncio.run(scenario())
+        self.assertEqual((stats['in_flight'], stats['queued']), (1, 1))
+        self.assertTrue(saturated)
+        # Executor threadlari connection ni qayta ishlatadi, asosiy threadga ta'sir qilmaydi
+        self.assertEqual(first, 60)
+        self.assertEqual(executor.stats(), {'workers': 1, 'queued': 0, 'in_flight': 0})
+        executor.pool.shutdown()
+
+    def test_connect_rejected_when_saturated(self):
+        user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=user, user_type='user')
+        chat = Chat.objects.create(user=user)
+        rejected = connect_rejected.value(consumer='ChatConsumer')
+
+        async def session():
+            communicator = WebsocketCommunicator(
+                ChatBenchmark().application, f'/ws/chat/{chat.id}/?token={token_for(user)}')
+            connected, _ = await communicator.connect()
+            return connected
+
+        max_queue, db_executor.max_queue = db_executor.max_queue, 0
+        try:
+            self.assertFalse(asyncio.run(session()))
+        finally:
+            db_executor.max_queue = max_queue
+        self.assertEqual(connect_rejected.value(consumer='ChatConsumer'), rejected + 1)
+        self.assertTrue(asyncio.run(session()))
+
+
+@override_settings(CHAT_DB_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Ikkala DB alohida, replikatsiya yo'q: qaysi DB dan o'qilgani natijadan ko'rinadi
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        with replica_reads(self.user.id):
+            self.assertFalse(Chat.objects.filter(id=self.chat.id).exists())
+            chat = Chat.objects.create(user=User.objects.create_user('user2'))
+        self.assertTrue(Chat.objects.filter(id=chat.id).exists())
+        self.assertFalse(Chat.objects.using('replica').filter(id=chat.id).exists())
+
+        # Transaction ichida o'qishlar primary da qoladi
+        with transaction.atomic(), replica_reads(self.user.id):
+            self.assertTrue(Chat.objects.filter(id=chat.id).exists())
+
+    def test_user_sticks_to_primary_after_write(self):
+        stick_to_primary(self.user.id)
+        with replica_reads(self.user.id):
+            self.assertTrue(Chat.objects.filter(id=self.chat.id).exists())
+        # Boshqa userlar replica dan o'qishda davom etadi
+        with replica_reads(self.user.id + 1):
+            self.assertFalse(Chat.objects.filter(id=self.chat.id).exists())
+
+    def test_history_view_reads_own_writes(self):
+        user = User.objects.create_user('user2', password='user123')
+        UserProfile.objects.create(user=user, user_type='user')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(user)}'}
+        # ChatView primary da chat yaratadi, keyingi o'qishlar ham primary dan
+        chat_id = self.client.get('/api/chat/', **auth).json()['chat_id']
+        url = f'/api/chat/{chat_id}/messages/'
+        self.assertEqual(self.client.get(url, **auth).status_code, 200)
+
+        save_message(Chat.objects.get(id=chat_id), user, 'salom', [])
+        response = self.client.get(url, **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['messages'][0]['content'], 'salom')
+
+
+class RecentMessageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        recent_messages.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+        self.messages = [save_message(self.chat, self.user, f'message {i}', [])[0] for i in range(5)]
+
+    def test_last_seen_timestamps_are_aware(self):
+        utc = dt_timezone.utc
+        self.assertEqual(parse_last_seen('2020-01-01T00:00:00'), ('timestamp', datetime(2020, 1, 1, tzinfo=utc)))
+        # `+` query string da encode qilinmagan
+        self.assertEqual(parse_last_seen('2020-01-01T05:00:00 05:00'), ('timestamp', datetime(2020, 1, 1, tzinfo=utc)))
+
+        get_missed_messages(self.chat, None, 50)
+        naive = parse_last_seen(self.messages[2].timestamp.replace(tzinfo=None).isoformat())
+        self.assertFalse(is_up_to_date(self.chat.id, naive))
+        data = get_missed_messages(self.chat, naive, 50)
+        self.assertEqual([m['message'] for m in data['messages']], ['message 3', 'message 4'])
+
+    def test_marker_only_moves_forward(self):
+        newest, older = self.messages[-1], self.messages[1]
+        remember_last_message(newest)
+        # Oldinroq boshlangan save keyinroq tugadi
+        remember_last_message(older)
+        self.assertEqual(cache.get(last_message_key(self.chat.id))['id'], newest.id)
+        self.assertTrue(is_up_to_date(self.chat.id, ('id', newest.id)))
+        self.assertFalse(is_up_to_date(self.chat.id, ('id', older.id)))
+
+    def test_second_connect_is_served_from_buffer(self):
+        first = get_missed_messages(self.chat, None, 50)
+        with self.assertNumQueries(0):
+            second = get_missed_messages(self.chat, None, 50)
+            resumed = get_missed_messages(self.chat, ('id', self.messages[2].id), 50)
+
+        self.assertEqual(first, second)
+        self.assertEqual([m['message'] for m in resumed['messages']], ['message 3', 'message 4'])
+        self.assertEqual(recent_messages.stats()['hits'], 2)
+
+    def test_buffer_page_window(self):
+        recent = RecentMessageCache(10, 10 ** 6, 3).put(
+            self.chat.id, project_messages(self.messages, content_key='message'), False, 1)
+
+        # Eng yangi 3 tasi bufferda, eskiroqlari uchun DB kerak
+        self.assertEqual([m['id'] for m in recent.page(None, 2)[0]], [m.id for m in self.messages[3:]])
+        self.assertTrue(recent.page(None, 2)[1])
+        self.assertEqual(recent.page(('id', self.messages[3].id), 2)[:2], ([recent.entries[2][0]], False))
+        self.assertIsNone(recent.page(('id', self.messages[0].id), 5))
+        messages, has_more, _ = recent.page(('id', self.messages[0].id), 2)
+        self.assertEqual(([m['id'] for m in messages], has_more), ([m.id for m in self.messages[3:]], True))
+
+    def test_new_message_and_delete_invalidate(self):
+        get_missed_messages(self.chat, None, 50)
+        message, _ = save_message(self.chat, self.user, 'yangi', [])
+        # Boshqa process yozgan (buffer ga append qilinmagan) - marker mos kelmaydi
+        self.assertEqual(get_missed_messages(self.chat, None, 50)['messages'][-1]['message'], 'yangi')
+
+        message.delete()
+        with self.assertNumQueries(3):
+            data = get_missed_messages(self.chat, None, 50)
+        self.assertEqual(data['messages'][-1]['message'], 'message 4')
+
+    def test_append_after_other_process_write(self):
+        get_missed_messages(self.chat, None, 50)
+        # Boshqa process yozgan, bu process bufferiga append qilinmagan
+        save_message(self.chat, self.user, 'boshqa process', [])
+
+        previous_id = cache.get(last_message_key(self.chat.id))['id']
+        message, _ = save_message(self.chat, self.user, 'shu process', [])
+        payload = project_messages([message], content_key='message')[0]
+        recent_messages.append(self.chat.id, payload, message.timestamp, 100, previous_id)
+
+        data = get_missed_messages(self.chat, None, 50)
+        self.assertEqual([m['message'] for m in data['messages']][-2:], ['boshqa process', 'shu process'])
+
+    def test_append_to_current_buffer(self):
+        get_missed_messages(self.chat, None, 50)
+        previous_id = cache.get(last_message_key(self.chat.id))['id']
+        message, _ = save_message(self.chat, self.user, 'yangi', [])
+        payload = project_messages([message], content_key='message')[0]
+        recent_messages.append(self.chat.id, payload, message.timestamp, 100, previous_id)
+        recent_messages.append(self.chat.id, payload, message.timestamp, 100, previous_id)
+
+        with self.assertNumQueries(0):
+            data = get_missed_messages(self.chat, None, 50)
+        self.assertEqual([m['message'] for m in data['messages']][-2:], ['message 4', 'yangi'])
+
+    def test_delete_in_other_process_invalidates(self):
+        get_missed_messages(self.chat, None, 50)
+        # Boshqa processdagi delete: signal bu process bufferiga yetmaydi, faqat umumiy revision oshadi
+        Message.objects.filter(id=self.messages[2].id)._raw_delete('default')
+        bump_chat_revision(self.chat.id)
+
+        data = get_missed_messages(self.chat, None, 50)
+        self.assertNotIn('message 2', [m['message'] for m in data['messages']])
+        self.assertEqual(recent_messages.stats()['misses'], 2)
+
+    def test_eviction_by_size(self):
+        payloads = project_messages(self.messages, content_key='message')
+        size = len(encoding.dumps(payloads[0]))
+        buffers = RecentMessageCache(10, size * 6, 5)
+        buffers.put('a', payloads, False, 1)
+        buffers.put('b', payloads, False, 1)
+
+        self.assertIsNone(buffers.get('a', {'id': self.messages[-1].id}, 1))
+        self.assertIsNotNone(buffers.get('b', {'id': self.messages[-1].id}, 1))
+        self.assertIsNone(buffers.get('b', {'id': self.messages[-1].id}, 2))
+        self.assertEqual(buffers.stats()['chats'], 1)
+
+
+class TranscriptExportTests(TestCase):
+    def setUp(self):
+        principal_cache.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        for i in range(5):
+            save_message(self.chat, self.user, f'message {i}', ['visa'])
+        list(archive_messages(Message.objects.order_by('id')[2].timestamp, batch_size=10))
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.admin)}'}
+
+    def export(self, query, **auth):
+        return self.client.get(f'/api/admin/export/?{query}', **(auth or self.auth))
+
+    def test_messages_are_read_in_chunks(self):
+        # archive (2 ta) + hot (3 ta): har chunk uchun cursor fetch + mention query
+        with self.assertNumQueries(5):
+            messages = list(transcript_messages(chat_id=self.chat.id, chunk_size=2))
+        self.assertEqual([m['content'] for m in messages], [f'message {i}' for i in range(5)])
+        self.assertEqual({tuple(m['mentions']) for m in messages}, {('visa',)})
+
+    def test_ndjson_and_csv(self):
+        response = self.export(f'chat={self.chat.id}')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([encoding.loads(line)['content'] for line in lines], [f'message {i}' for i in range(5)])
+
+        response = self.export(f'chat={self.chat.id}&output=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(rows[0], 'id,chat_id,sender,sender_type,content,timestamp,mentions')
+        self.assertEqual(len(rows), 6)
+
+    def test_date_range_and_validation(self):
+        since = Message.objects.order_by('id')[1].timestamp.isoformat().replace('+', '%2B')
+        response = self.export(f'date_from={since}&date_to={timezone.now().isoformat().replace("+", "%2B")}')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2)
+
+        self.assertEqual(self.export(f'date_from={since}').status_code, 400)
+        self.assertEqual(self.export(f'chat={self.chat.id}&output=xml').status_code, 400)
+        user_auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.user)}'}
+        self.assertEqual(self.export(f'chat={self.chat.id}', **user_auth).status_code, 403)
+
+    def test_async_stream_closes_source(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield b'a'
+                yield b'b'
+            finally:
+                closed.append(True)
+
+        async def first():
+            stream = stream_async(chunks())
+            chunk = await stream.__anext__()
+            await stream.aclose()
+            return chunk
+
+        self.assertEqual(asyncio.run(first()), b'a')
+        self.assertEqual(closed, [True])
+
+
+class DatasetGeneratorTests(TestCase):
+    def generate(self, **kwargs):
+        end = datetime(2025, 6, 1, tzinfo=dt_timezone.utc)
+        return DatasetGenerator(5, 8, seed=7, end=end, mention_rate=0.5, batch_size=12, **kwargs).run()
+
+    def snapshot(self):
+        return list(Message.objects.order_by('chat_id', 'timestamp').values_list(
+            'chat_id', 'sender__username', 'content', 'timestamp'))
+
+    def test_dataset_is_consistent_and_deterministic(self):
+        stats = self.generate(fast_hasher=True)
+        self.assertEqual((stats['users'], stats['chats'], stats['messages']), (7, 5, 40))
+        self.assertEqual(Message.mentions.through.objects.count(), stats['mentions'])
+        self.assertEqual(Notification.objects.count(), stats['notifications'])
+
+        # Summary va unread counter lar servis yozganidek
+        for chat in Chat.objects.all():
+            last = Message.objects.filter(chat=chat).order_by('-timestamp').first()
+            self.assertEqual((chat.message_count, chat.last_message_at), (8, last.timestamp))
+        for profile in UserProfile.objects.all():
+            unread = Notification.objects.filter(user_profile=profile, is_read=False).count()
+            self.assertEqual(profile.unread_notifications, unread)
+        notification = Notification.objects.select_related('message').first()
+        self.assertEqual(notification.created_at, notification.message.timestamp)
+        self.assertIsNotNone(authenticate(username='synth_user3', password='synth123'))
+
+        first = self.snapshot()
+        User.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_same_seed_with_another_prefix(self):
+        self.generate()
+        stats = self.generate(prefix='other')
+
+        self.assertEqual((stats['chats'], Chat.objects.count()), (5, 10))
+        self.assertEqual(Message.objects.filter(chat__user__username__startswith='other_').count(), 40)
+
+    def test_failed_batch_leaves_nothing_behind(self):
+        User.objects.create_user('synth_user0', password='user123')
+        with self.assertRaises(IntegrityError):
+            self.generate()
+        # Adminlar va birinchi batch bitta transaction da qaytarildi
+        self.assertFalse(User.objects.filter(username__startswith='synth_admin').exists())
+        self.assertEqual((Chat.objects.count(), Message.objects.count()), (0, 0))
+
+
+class UserDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, user_type in [('visa', 'visa_admin'), ('vali', 'user'), ('valijon', 'user'), ('ali', 'user')]:
+            user = User.objects.create_user(name, password='x')
+            UserProfile.objects.create(user=user, user_type=user_type)
+        User.objects.create_user('vaqif', password='x', is_active=False)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(User.objects.get(username="ali"))}'}
+
+    def test_prefix_pages(self):
+        first = self.client.get('/api/users/?q=v&limit=2', **self.auth).json()
+        self.assertEqual([u['username'] for u in first['users']], ['vali', 'valijon'])
+        self.assertTrue(first['has_more'])
+        rest = self.client.get(f"/api/users/?q=v&limit=2&after={first['after']}", **self.auth).json()
+        self.assertEqual(rest['users'], [{'id': rest['users'][0]['id'], 'username': 'visa', 'user_type': 'visa_admin'}])
+        self.assertFalse(rest['has_more'])
+
+    def test_cached_until_user_or_profile_changes(self):
+        directory_page('v', 10)
+        with self.assertNumQueries(0):
+            directory_page('v', 10)
+
+        profile = UserProfile.objects.get(user__username='vali')
+        profile.user_type = 'master_admin'
+        profile.save()
+        self.assertIn({'id': profile.user_id, 'username': 'vali', 'user_type': 'master_admin'},
+                      directory_page('v', 10)['users'])
+
+        User.objects.filter(username='vali').update(is_active=False)
+        User.objects.get(username='visa').save()
+        self.assertNotIn('vali', [u['username'] for u in directory_page('v', 10)['users']])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        recent_messages.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        self.profile = UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        save_message(self.chat, self.admin, 'salom', ['user1'])
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.user)}'}
+
+    def poll(self, url, etag=None):
+        headers = dict(self.auth, HTTP_IF_NONE_MATCH=etag) if etag else self.auth
+        return self.client.get(url, **headers)
+
+    def test_chat_messages(self):
+        url = f'/api/chat/{self.chat.id}/messages/'
+        first = self.poll(url)
+        get_principal(self.user.id)
+        # Chat pk lookup, marker va revision cache dan
+        with self.assertNumQueries(1):
+            self.assertEqual(self.poll(url, first['ETag']).status_code, 304)
+        self.assertEqual(self.poll(f'{url}?limit=1', first['ETag']).status_code, 200)
+
+        message, _ = save_message(self.chat, self.user, 'yangi', [])
+        second = self.poll(url, first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['messages'][-1]['content'], 'yangi')
+
+        # Oxirgi bo'lmagan message o'chirildi - revision o'zgaradi
+        Message.objects.filter(content='salom').delete()
+        self.assertEqual(self.poll(url, second['ETag']).status_code, 200)
+
+    def test_notifications(self):
+        url = '/api/notifications/'
+        first = self.poll(url)
+        self.assertEqual(first.json()['count'], 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.poll(url, first['ETag']).status_code, 304)
+
+        mark_notifications_read(self.profile)
+        self.assertEqual(self.poll(url, first['ETag']).status_code, 200)
+
+    def test_chat_view(self):
+        first = self.poll('/api/chat/')
+        with self.assertNumQueries(0):
+            response = self.poll('/api/chat/', first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+
+class ChatMessagesPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        UserProfile.objects.create(user=self.user, user_type='user')
+        self.chat = Chat.objects.create(user=self.user)
+        self.url = f'/api/chat/{self.chat.id}/messages/'
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.user)}'}
+
+        now = timezone.now()
+        self.ids = []
+        # 2 va 3 - bir xil timestamp (id bo'yicha ajratiladi)
+        for i, offset in enumerate((5, 4, 3, 3, 1)):
+            message, _ = save_message(self.chat, self.user, f'm{i}', [])
+            Message.objects.filter(id=message.id).update(timestamp=now - timedelta(minutes=offset))
+            self.ids.append(message.id)
+
+    def page(self, **params):
+        response = self.client.get(self.url, params, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [message['id'] for message in body['messages']], body['has_more'], body['cursors']
+
+    def test_before_pages_walk_back_without_gaps(self):
+        ids, has_more, cursors = self.page(limit=2)
+        self.assertEqual(ids, self.ids[3:])
+        self.assertTrue(has_more)
+
+        # Sahifa chegarasi bir xil timestamp li ikki message orasida
+        ids, has_more, cursors = self.page(limit=2, before=cursors['before'])
+        self.assertEqual(ids, self.ids[1:3])
+        self.assertTrue(has_more)
+
+        ids, has_more, cursors = self.page(limit=2, before=cursors['before'])
+        self.assertEqual(ids, self.ids[:1])
+        self.assertFalse(has_more)
+
+    def test_after_pages_walk_forward(self):
+        ids, _, cursors = self.page(limit=1, before=self.page(limit=4)[2]['before'])
+        self.assertEqual(ids, self.ids[:1])
+
+        ids, has_more, cursors = self.page(limit=3, after=cursors['after'])
+        self.assertEqual(ids, self.ids[1:4])
+        self.assertTrue(has_more)
+
+        ids, has_more, cursors = self.page(limit=3, after=cursors['after'])
+        self.assertEqual(ids, self.ids[4:])
+        self.assertFalse(has_more)
+        self.assertEqual(self.page(after=cursors['after'])[:2], ([], False))
+
+    def test_invalid_cursor(self):
+        cursor = encode_cursor(timezone.now(), 1)
+        for params in (
+            {'before': 'not-a-cursor'},
+            {'after': encode_cursor(timezone.now(), 'abc')},
+            {'before': cursor, 'after': cursor},
+            {'limit': 0},
+            {'limit': 'ten'},
+        ):
+            response = self.client.get(self.url, params, **self.auth)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()['status'], 'error')
+
+
+class NotificationPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.user = User.objects.create_user('user1', password='user123')
+        self.profile = UserProfile.objects.create(user=self.user, user_type='user')
+        self.admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.chat = Chat.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.user)}'}
+
+        self.now = timezone.now()
+        self.ids = []
+        # 1 va 2 - bir xil created_at
+        for i, offset in enumerate((5, 4, 4, 2, 1)):
+            _, notifications = save_message(self.chat, self.admin, f'@user1 n{i}', ['user1'])
+            Notification.objects.filter(id=notifications[0].id).update(
+                created_at=self.now - timedelta(minutes=offset)
+            )
+            self.ids.append(notifications[0].id)
+        # O'qilganlari ro'yxatga kirmaydi
+        mark_notifications_read(self.profile, id=self.ids[3])
+        self.unread = self.ids[:3] + self.ids[4:]
+
+    def page(self, **params):
+        response = self.client.get('/api/notifications/', params, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['count'], 4)
+        return [n['id'] for n in body['notifications']], body['has_more'], body['before']
+
+    def test_before_pages_newest_first(self):
+        ids, has_more, before = self.page(limit=2)
+        self.assertEqual(ids, [self.unread[3], self.unread[2]])
+        self.assertTrue(has_more)
+
+        ids, has_more, before = self.page(limit=2, before=before)
+        self.assertEqual(ids, [self.unread[1], self.unread[0]])
+        self.assertFalse(has_more)
+
+        self.assertEqual(self.page(before=before)[:2], ([], False))
+
+    def test_since_filter(self):
+        since = (self.now - timedelta(minutes=4)).isoformat()
+        ids, has_more, before = self.page(since=since)
+        self.assertEqual(ids, [self.unread[3]])
+        self.assertFalse(has_more)
+
+        ids, _, _ = self.page(since=(self.now - timedelta(minutes=10)).isoformat(), limit=1)
+        self.assertEqual(ids, [self.unread[3]])
+        self.assertEqual(self.page(since=self.now.isoformat())[:2], ([], False))
+
+    def test_invalid_params(self):
+        for params in ({'since': 'kecha'}, {'before': 'not-a-cursor'}, {'limit': -1}):
+            response = self.client.get('/api/notifications/', params, **self.auth)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()['status'], 'error')
+
+
+class AdminInboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.admin = User.objects.create_user('visa', password='visa123')
+        UserProfile.objects.create(user=self.admin, user_type='visa_admin')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token_for(self.admin)}'}
+
+        now = timezone.now()
+        self.chats = []
+        for i, (offset, messages) in enumerate(((3, 2), (1, 1), (2, 3))):
+            user = User.objects.create_user(f'user{i}', password='user123')
+            UserProfile.objects.create(user=user, user_type='user')
+            chat = Chat.objects.create(user=user)
+            for j in range(messages):
+                save_message(chat, user if j % 2 == 0 else self.admin, f'{user.username} {j}', [])
+            Chat.objects.filter(id=chat.id).update(last_message_at=now - timedelta(minutes=offset))
+            self.chats.append(chat)
+        # Messagesiz chat inbox da ko'rinmaydi
+        Chat.objects.create(user=User.objects.create_user('empty', password='user123'))
+
+    def inbox(self, **params):
+        response = self.client.get('/api/admin/inbox/', params, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_latest_activity_first_with_summary(self):
+        body = self.inbox()
+        self.assertEqual([c['user'] for c in body['chats']], ['user1', 'user2', 'user0'])
+        self.assertFalse(body['has_more'])
+        self.assertEqual(
+            [(c['message_count'], c['last_message_preview'], c['last_sender']) for c in body['chats']],
+            [(1, 'user1 0', 'user1'), (3, 'user2 2', 'user2'), (2, 'user0 1', 'visa')],
+        )
+
+    def test_before_cursor_and_constant_queries(self):
+        self.inbox()
+        with CaptureQueriesContext(connection) as small:
+            first = self.inbox(limit=1)
+        self.assertEqual([c['user'] for c in first['chats']], ['user1'])
+        self.assertTrue(first['has_more'])
+
+        with CaptureQueriesContext(connection) as large:
+            rest = self.inbox(limit=5, before=first['before'])
+        self.assertEqual([c['user'] for c in rest['chats']], ['user2', 'user0'])
+        self.assertFalse(rest['has_more'])
+        # Sahifa hajmidan qat'i nazar bir xil query soni (Message jadvaliga murojaat yo'q)
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(any('chat_message' in q['sql'] for q in large.captured_queries))
+
+        response = self.client.get('/api/admin/inbox/', {'before': 'not-a-cursor'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_admins(self):
+        user = self.chats[0].user
+        response = self.client.get('/api/admin/inbox/', HTTP_AUTHORIZATION=f'Bearer {token_for(user)}')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get('/api/admin/inbox/').status_code, 403)
+
+        master = User.objects.create_user('master', password='master123')
+        UserProfile.objects.create(user=master, user_type='master_admin')
+        response = self.client.get('/api/admin/inbox/', HTTP_AUTHORIZATION=f'Bearer {token_for(master)}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_chat_summaries(self):
+        def summaries():
+            return {row[0]: row[1:] for row in Chat.objects.values_list(
+                'id', 'last_message_preview', 'last_sender_id', 'message_count')}
+
+        expected = summaries()
+        expected[self.chats[1].id] = ('', None, 0)
+        Message.objects.filter(chat=self.chats[1]).delete()
+        Chat.objects.update(last_message_at=None, last_message_preview='', last_sender=None, message_count=0)
+
+        call_command('rebuild_chat_summaries', stdout=io.StringIO())
+        self.assertEqual(summaries(), expected)
+        self.assertIsNone(Chat.objects.get(id=self.chats[1].id).last_message_at)
+        self.assertEqual([c['user'] for c in self.inbox()['chats']], ['user2', 'user0'])
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
-    LoginView, ChatView, ChatMessagesView, UserListView,
-    NotificationListView, NotificationReadView
+    LoginView, ChatView, ChatMessagesView, UserListView, AdminInboxView, MessageSearchView,
+    NotificationListView, NotificationReadView, NotificationCountView,
+    NotificationBulkReadView, TranscriptExportView
 )
 
 urlpatterns = [
@@ -9,8 +10,13 @@ urlpatterns = [
     path('chat/', ChatView.as_view(), name='chat'),
     path('chat/<uuid:chat_id>/messages/', ChatMessagesView.as_view(), name='chat-messages'),
     path('users/', UserListView.as_view(), name='user-list'),
+    path('admin/inbox/', AdminInboxView.as_view(), name='admin-inbox'),
+    path('admin/export/', TranscriptExportView.as_view(), name='transcript-export'),
+    path('search/', MessageSearchView.as_view(), name='message-search'),
 
     # Notifications
     path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('notifications/count/', NotificationCountView.as_view(), name='notification-count'),
+    path('notifications/read/', NotificationBulkReadView.as_view(), name='notification-bulk-read'),
     path('notifications/<int:notification_id>/read/', NotificationReadView.as_view(), name='notification-read'),
 ]
@@ -0,0 +1,19 @@
+import time
+
+from django.core.cache import cache
+
+
+def cached_version(key):
+    """Cache dagi versiya raqami. Key yo'qolgan bo'lsa yangi (oldingilariga teng bo'lmagan) qiymat."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
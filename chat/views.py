@@ -1,13 +1,34 @@
+import uuid
+from datetime import timezone as dt_timezone
 import jwt
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import Chat, UserProfile, Notification
-from .serializers import UserSerializer
+from .metrics import registry
+from .archive import history_page, project_history
+from .history import current_marker, newest_marker, user_chat_key
 from .authentication import JWTAuthentication
+from .conditional import (
+    chat_messages_etag, make_etag, not_modified, notification_watermark, notifications_etag, with_etag
+)
+from .directory import directory_page
+from .export import EXPORT_FORMATS, transcript_response
+from .permissions import ADMIN_TYPES, IsChatAdmin
+from .principals import get_principal
+from .routers import choose_read_alias, reading_from_replica, reads_from_replica, stick_to_primary
+from .search import encode_rank_cursor, search_messages
+from .projections import message_queryset, project_message, project_notification
+from .pagination import InvalidCursor, encode_cursor, get_page_size, keyset_page
+from .services import mark_notifications_read
 
 
 class LoginView(APIView):
@@ -43,96 +64,325 @@ class ChatView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        chat, _ = Chat.objects.get_or_create(user=request.user)
-        return Response({'chat_id': str(chat.id)})
+        # Chat id o'zgarmaydi - cache da (chat o'chirilganda signal tozalaydi)
+        chat_id = cache.get(user_chat_key(request.user.id))
+        if chat_id is None:
+            chat, created = Chat.objects.get_or_create(user=request.user)
+            if created:
+                # Yangi chat replica ga hali yetib bormagan bo'lishi mumkin
+                stick_to_primary(request.user.id)
+            chat_id = str(chat.id)
+            cache.set(user_chat_key(request.user.id), chat_id, timeout=None)
+
+        etag = make_etag('chat', chat_id)
+        return not_modified(request, etag) or with_etag(Response({'chat_id': chat_id}), etag)
 
 
 class ChatMessagesView(APIView):
+    """
+    Chat history sahifalari. ETag oxirgi message marker idan, shuning uchun
+    o'zgarmagan poll 304 bilan (chat pk lookup dan boshqa query siz) qaytadi.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    @reads_from_replica
     def get(self, request, chat_id):
         try:
-            chat = Chat.objects.get(id=chat_id)
-
-            try:
-                user_profile = UserProfile.objects.get(user=request.user)
-                if user_profile.user_type not in ['visa_admin', 'master_admin'] and chat.user != request.user:
-                    return Response({'status': 'error', 'message': 'Access denied'}, status=403)
-            except UserProfile.DoesNotExist:
-                if chat.user != request.user:
-                    return Response({'status': 'error', 'message': 'Access denied'}, status=403)
-
-            messages = chat.messages.all().order_by('timestamp')
-            messages_data = []
-            for message in messages:
-                try:
-                    sender_profile = UserProfile.objects.get(user=message.sender)
-                    sender_type = sender_profile.user_type
-                except UserProfile.DoesNotExist:
-                    sender_type = 'user'
-
-                messages_data.append({
-                    'id': message.id,
-                    'sender': message.sender.username,
-                    'sender_type': sender_type,
-                    'content': message.content,
-                    'timestamp': message.timestamp.isoformat(),
-                    'mentions': [user.username for user in message.mentions.all()]
-                })
-
-            return Response({'status': 'success', 'messages': messages_data})
-
+            chat = Chat.objects.only('id', 'user_id').get(id=chat_id)
         except Chat.DoesNotExist:
             return Response({'status': 'error', 'message': 'Chat not found'}, status=404)
 
+        principal = get_principal(request.user.id)
+        if chat.user_id != request.user.id and (principal is None or principal.user_type not in ADMIN_TYPES):
+            return Response({'status': 'error', 'message': 'Access denied'}, status=403)
 
-class UserListView(APIView):
+        etag = chat_messages_etag(request, chat.id, current_marker(chat.id))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        try:
+            limit = get_page_size(
+                request.query_params.get('limit'),
+                settings.CHAT_MESSAGES_PAGE_SIZE,
+                settings.CHAT_MESSAGES_MAX_PAGE_SIZE,
+            )
+            # Hot oynadan o'tib ketilsa archive dan o'qiladi
+            cold_rows, hot_rows, has_more = history_page(
+                chat, limit,
+                before=request.query_params.get('before'),
+                after=request.query_params.get('after'),
+            )
+        except InvalidCursor as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        if reading_from_replica():
+            # Replica marker dan orqada bo'lishi mumkin - ETag o'qilgan ma'lumotdan yangi bo'lmasin
+            etag = chat_messages_etag(request, chat.id, newest_marker(chat.id))
+
+        messages = cold_rows + hot_rows
+        messages_data = project_history(cold_rows, hot_rows)
+
+        return with_etag(Response({
+            'status': 'success',
+            'messages': messages_data,
+            'has_more': has_more,
+            'cursors': {
+                'before': encode_cursor(messages[0].timestamp, messages[0].id) if messages else None,
+                'after': encode_cursor(messages[-1].timestamp, messages[-1].id) if messages else None,
+            },
+        }), etag)
+
+
+class AdminInboxView(APIView):
+    """
+    Adminlar uchun barcha chatlar, oxirgi faollik bo‘yicha. Faqat Chat dagi
+    summary fieldlardan o‘qiladi, Message jadvaliga murojaat yo‘q.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsChatAdmin]
+
+    def get(self, request):
+        chats = Chat.objects.filter(last_message_at__isnull=False).select_related(
+            'user', 'last_sender'
+        )
+
+        try:
+            limit = get_page_size(
+                request.query_params.get('limit'),
+                settings.ADMIN_INBOX_PAGE_SIZE,
+                settings.ADMIN_INBOX_MAX_PAGE_SIZE,
+            )
+            chats, has_more = keyset_page(
+                chats, 'last_message_at', limit,
+                before=request.query_params.get('before'),
+            )
+        except InvalidCursor as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        # Eng so‘nggi faol chat birinchi
+        chats.reverse()
+        oldest = chats[-1] if chats else None
+
+        return Response({
+            'status': 'success',
+            'chats': [{
+                'chat_id': str(chat.id),
+                'user': chat.user.username,
+                'last_message_at': chat.last_message_at.isoformat(),
+                'last_message_preview': chat.last_message_preview,
+                'last_sender': chat.last_sender.username if chat.last_sender else None,
+                'message_count': chat.message_count,
+            } for chat in chats],
+            'has_more': has_more,
+            'before': encode_cursor(oldest.last_message_at, oldest.id) if oldest else None,
+        })
+
+
+class MessageSearchView(APIView):
+    """
+    Message matnidan qidirish (rank bo‘yicha). Adminlar barcha chatlarda,
+    oddiy user faqat o‘z chatida qidiradi. `chat`, `sender`, `date_from`, `date_to` filterlari.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'status': 'error', 'message': 'q is required'}, status=400)
+
+        try:
+            chat_ids = None
+            if request.query_params.get('chat'):
+                chat_ids = {uuid.UUID(request.query_params['chat'])}
+            sender_id = int(request.query_params['sender']) if request.query_params.get('sender') else None
+        except ValueError:
+            return Response({'status': 'error', 'message': 'Invalid chat or sender'}, status=400)
 
+        dates = {}
+        for key in ('date_from', 'date_to'):
+            if request.query_params.get(key):
+                dates[key] = parse_datetime(request.query_params[key])
+                if dates[key] is None:
+                    return Response({'status': 'error', 'message': f'Invalid {key}'}, status=400)
+                # Timezone siz sana UTC deb olinadi (timestamplar aware)
+                if timezone.is_naive(dates[key]):
+                    dates[key] = timezone.make_aware(dates[key], dt_timezone.utc)
 
-class NotificationListView(APIView):
+        principal = get_principal(request.user.id)
+        if principal.user_type not in ADMIN_TYPES:
+            own = set(Chat.objects.filter(user=request.user).values_list('id', flat=True))
+            chat_ids = own if chat_ids is None else chat_ids & own
+
+        try:
+            limit = get_page_size(
+                request.query_params.get('limit'),
+                settings.SEARCH_PAGE_SIZE,
+                settings.SEARCH_MAX_PAGE_SIZE,
+            )
+            messages, ranks, has_more = search_messages(
+                message_queryset(), text, limit,
+                cursor=request.query_params.get('cursor'),
+                chat_ids=chat_ids, sender_id=sender_id, **dates,
+            )
+        except InvalidCursor as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        results = []
+        for message, rank in zip(messages, ranks):
+            data = project_message(message)
+            data['chat_id'] = str(message.chat_id)
+            data['rank'] = rank
+            results.append(data)
+
+        return Response({
+            'status': 'success',
+            'results': results,
+            'has_more': has_more,
+            'cursor': encode_rank_cursor(ranks[-1], messages[-1].id) if has_more else None,
+        })
+
+
+class TranscriptExportView(APIView):
+    """
+    Adminlar uchun to'liq transcript (archive bilan), stream qilinadi: bitta chat
+    (`chat`) yoki `date_from`..`date_to` oralig'idagi barcha chatlar.
+    `output=ndjson|csv`, `gzip=1`. Xotira sarfi messagelar soniga bog'liq emas.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsChatAdmin]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({'status': 'error', 'message': 'Invalid output'}, status=400)
+
+        chat_id = None
+        if request.query_params.get('chat'):
+            try:
+                chat_id = uuid.UUID(request.query_params['chat'])
+            except ValueError:
+                return Response({'status': 'error', 'message': 'Invalid chat'}, status=400)
+
+        dates = {}
+        for key in ('date_from', 'date_to'):
+            if request.query_params.get(key):
+                dates[key] = parse_datetime(request.query_params[key])
+                if dates[key] is None:
+                    return Response({'status': 'error', 'message': f'Invalid {key}'}, status=400)
+                # Timezone siz sana UTC deb olinadi (timestamplar aware)
+                if timezone.is_naive(dates[key]):
+                    dates[key] = timezone.make_aware(dates[key], dt_timezone.utc)
+
+        if chat_id is None and len(dates) < 2:
+            return Response(
+                {'status': 'error', 'message': 'chat or date_from and date_to is required'}, status=400
+            )
+        if chat_id is not None and not Chat.objects.filter(id=chat_id).exists():
+            return Response({'status': 'error', 'message': 'Chat not found'}, status=404)
+
+        return transcript_response(
+            output,
+            compress=request.query_params.get('gzip') in ('1', 'true'),
+            asgi=isinstance(request._request, ASGIRequest),
+            alias=choose_read_alias(request.user.id) or DEFAULT_DB_ALIAS,
+            chat_id=chat_id,
+            **dates,
+        )
+
+
+class UserListView(APIView):
     """
-    Foydalanuvchining barcha o‘qilmagan notificationlarini olish
+    Mention autocomplete uchun user directory: `q` - username prefiksi,
+    `after` - oldingi sahifaning oxirgi username i. Sahifalar cache da,
+    user yoki profil o'zgarganda versiya almashadi (chat.signals).
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    @reads_from_replica
     def get(self, request):
         try:
-            user_profile = UserProfile.objects.get(user=request.user)
-            notifications = Notification.objects.filter(
-                user_profile=user_profile, is_read=False
+            limit = get_page_size(
+                request.query_params.get('limit'),
+                settings.USERS_PAGE_SIZE,
+                settings.USERS_MAX_PAGE_SIZE,
             )
-            notifications_data = []
+        except InvalidCursor as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
 
-            for notification in notifications:
-                notifications_data.append({
-                    'id': notification.id,
-                    'message': notification.message.content,
-                    'sender': notification.message.sender.username,
-                    'chat_id': str(notification.chat_id),
-                    'timestamp': notification.created_at.isoformat()
-                })
+        page = directory_page(
+            request.query_params.get('q', '').strip(),
+            limit,
+            after=request.query_params.get('after') or None,
+        )
+        return Response({'status': 'success', **page})
 
-            return Response({
-                'status': 'success',
-                'count': len(notifications_data),
-                'notifications': notifications_data
-            })
 
-        except UserProfile.DoesNotExist:
+class NotificationListView(APIView):
+    """
+    Foydalanuvchining o‘qilmagan notificationlari, eng yangisidan boshlab sahifalab.
+    `before` - keyingi (eskiroq) sahifa cursori, `since` - shu vaqtdan keyingilari.
+    ETag unread counter va watermark dan: o'zgarmagan poll bitta query bilan 304.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @reads_from_replica
+    def get(self, request):
+        watermark = notification_watermark(request.user)
+        if watermark is None:
             return Response({
                 'status': 'error',
                 'message': 'User profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
 
+        profile_id, unread, _ = watermark
+        etag = notifications_etag(request, *watermark)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        notifications = Notification.objects.filter(
+            user_profile_id=profile_id, is_read=False
+        ).select_related('message__sender').only(
+            'id', 'chat_id', 'created_at', 'message__content', 'message__sender__username'
+        )
+
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'status': 'error', 'message': 'Invalid since'}, status=400)
+            notifications = notifications.filter(created_at__gt=since)
+
+        try:
+            limit = get_page_size(
+                request.query_params.get('limit'),
+                settings.NOTIFICATIONS_PAGE_SIZE,
+                settings.NOTIFICATIONS_MAX_PAGE_SIZE,
+            )
+            notifications, has_more = keyset_page(
+                notifications, 'created_at', limit,
+                before=request.query_params.get('before'),
+            )
+        except InvalidCursor as e:
+            return Response({'status': 'error', 'message': str(e)}, status=400)
+
+        # Eng yangisi birinchi
+        notifications.reverse()
+        oldest = notifications[-1] if notifications else None
+
+        return with_etag(Response({
+            'status': 'success',
+            'count': unread,
+            'notifications': [project_notification(n) for n in notifications],
+            'has_more': has_more,
+            'before': encode_cursor(oldest.created_at, oldest.id) if oldest else None,
+        }), etag)
+
 
 class NotificationReadView(APIView):
     """
@@ -144,11 +394,10 @@ class NotificationReadView(APIView):
     def post(self, request, notification_id):
         try:
             user_profile = UserProfile.objects.get(user=request.user)
-            notification = Notification.objects.get(
-                id=notification_id, user_profile=user_profile
-            )
-            notification.is_read = True
-            notification.save()
+            if not mark_notifications_read(user_profile, id=notification_id):
+                # Yo'q yoki avval o'qilgan - farqlash uchun bitta indexed lookup
+                if not Notification.objects.filter(id=notification_id, user_profile=user_profile).exists():
+                    raise Notification.DoesNotExist
 
             return Response({
                 'status': 'success',
@@ -166,3 +415,72 @@ class NotificationReadView(APIView):
                 'status': 'error',
                 'message': 'Notification not found'
             }, status=status.HTTP_404_NOT_FOUND)
+
+
+class NotificationCountView(APIView):
+    """
+    O‘qilmagan notificationlar soni (denormalized counter, qatorlar yuklanmaydi)
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        count = UserProfile.objects.filter(user=request.user).values_list(
+            'unread_notifications', flat=True
+        ).first()
+        if count is None:
+            return Response({
+                'status': 'error',
+                'message': 'User profile not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'status': 'success', 'count': count})
+
+
+class NotificationBulkReadView(APIView):
+    """
+    Bir nechta notificationni bitta UPDATE bilan o‘qilgan qilish:
+    `up_to` - shu id gacha barchasi, `chat_id` - bitta chatdagi barchasi
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        filters = {}
+        try:
+            if request.data.get('up_to') is not None:
+                filters['id__lte'] = int(request.data['up_to'])
+            if request.data.get('chat_id'):
+                filters['chat_id'] = uuid.UUID(str(request.data['chat_id']))
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'Invalid up_to or chat_id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not filters:
+            return Response({
+                'status': 'error',
+                'message': 'up_to or chat_id is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user_profile = UserProfile.objects.get(user=request.user)
+        except UserProfile.DoesNotExist:
+            return Response({
+                'status': 'error',
+                'message': 'User profile not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        marked = mark_notifications_read(user_profile, **filters)
+        return Response({'status': 'success', 'marked': marked})
+
+
+def metrics_view(request):
+    # Prometheus scrape uchun oddiy Django view (JWT kerak emas)
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics_view.skip_metrics = True
@@ -0,0 +1,192 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+from .db import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+def reserve_message_ids(count):
+    """
+    Message id larni oldindan band qilish, broadcast DB insert ni kutmasligi uchun.
+    Postgres da sequence dan olinadi; SQLite (dev/test) da bitta process uchun max(id) dan davom etadi.
+    """
+    from .models import Message
+
+    table = Message._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"')
+        start = cursor.fetchone()[0] + 1
+    return list(range(start, start + count))
+
+
+class MessageIdAllocator:
+    """
+    Write-behind message id lari: har bir message uchun sequence dan alohida
+    olinadi, process ichida zaxira blok saqlanmaydi. Aks holda processlar
+    orasida id tartibi vaqt tartibidan ajraladi, resume esa `id__gt` ga tayanadi.
+    Bir vaqtda kelgan so'rovlar bitta nextval query ga yig'iladi.
+    """
+
+    def __init__(self):
+        self._waiters = []
+        self._task = None
+        self._loop = None
+        self._last = 0
+
+    async def next_id(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._waiters, self._task = loop, [], None
+        future = loop.create_future()
+        self._waiters.append(future)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._allocate())
+        return await future
+
+    async def _allocate(self):
+        while self._waiters:
+            waiters, self._waiters = self._waiters, []
+            try:
+                ids = await database_sync_to_async(reserve_message_ids)(len(waiters))
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            if ids[0] <= self._last:
+                # SQLite fallback: flush bo'lmagan id lar qayta berilmasin
+                ids = list(range(self._last + 1, self._last + 1 + len(ids)))
+            self._last = ids[-1]
+            # Bekor qilingan so'rovning id si bo'sh qoladi (sequence dagi oddiy gap)
+            for waiter, message_id in zip(waiters, ids):
+                if not waiter.done():
+                    waiter.set_result(message_id)
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind rejim: messagelar darhol broadcast qilinadi, keyin shu bufferga
+    tushadi va `batch_size` yoki `flush_interval` bo'yicha bulk_create bilan yoziladi.
+
+    Queue chegaralangan (to'lsa `put` kutadi), bitta flush task FIFO tartibda
+    ishlaydi, shuning uchun har bir chat ichidagi tartib saqlanadi.
+    """
+
+    def __init__(self, max_size, batch_size, flush_interval):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self._queue = None
+        self._task = None
+        self._pending = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush_sync)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_size)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, message, mentions):
+        self._ensure_started()
+        await self._queue.put((message, mentions))
+
+    @property
+    def depth(self):
+        return (self._queue.qsize() if self._queue else 0) + len(self._pending)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            # Queue dan olingan, lekin hali yozilmagan messagelar ham shutdown flush ga kiradi
+            with self._lock:
+                batch = self._pending = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        await database_sync_to_async(self._write)(batch)
+
+    def _write(self, batch):
+        from .services import save_messages
+
+        started = time.monotonic()
+        try:
+            save_messages(batch)
+        except Exception:
+            logger.exception("Write-behind batch error, retrying messages one by one")
+            # Bitta buzuq message butun batchni yo'qotmasligi uchun bittalab
+            for item in batch:
+                try:
+                    save_messages([item])
+                except Exception:
+                    self.failed += 1
+                    logger.exception("Write-behind message error: message %s not saved", item[0].id)
+
+        elapsed = time.monotonic() - started
+        metrics.write_buffer_flush_seconds.observe(elapsed)
+        with self._lock:
+            self._pending = []
+            self.flushed += len(batch)
+            self.batches += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+
+    def flush_sync(self):
+        """Process to'xtayotganda qolgan messagelarni yozib qo'yish."""
+        batch = list(self._pending)
+        while self._queue is not None and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            self._write(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.depth,
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'failed': self.failed,
+                'last_flush_seconds': self.last_flush_seconds,
+                'max_flush_seconds': self.max_flush_seconds,
+                'avg_flush_seconds': self.total_flush_seconds / self.batches if self.batches else 0.0,
+            }
+
+
+message_ids = MessageIdAllocator()
+write_buffer = MessageWriteBuffer(
+    settings.CHAT_WRITE_BEHIND_MAX_QUEUE,
+    settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+)
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,9 +87,22 @@ DATABASES = {
         "PASSWORD": env('DB_PASSWORD'),
         "HOST": env('DB_HOST'),
         "PORT": env('DB_PORT'),
+        # ASGI da HTTP requestlar har xil threadda, shuning uchun default 0.
+        # WebSocket consumerlar chat.db executori orqali CHAT_DB_CONN_MAX_AGE bilan ishlaydi
+        "CONN_MAX_AGE": env.int('DB_CONN_MAX_AGE', default=0),
+        "CONN_HEALTH_CHECKS": env.bool('DB_CONN_HEALTH_CHECKS', default=True),
     }
 }
 
+# Read replicalar (streaming replication). History, notification va user ro'yxati
+# o'qishlari chat.routers.replica_reads orqali shu yerga yo'naltiriladi
+for _index, _host in enumerate(env.list('DB_REPLICA_HOSTS', default=[]), 1):
+    DATABASES[f'replica{_index}'] = dict(DATABASES['default'], HOST=_host, TEST={'MIRROR': 'default'})
+CHAT_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['chat.routers.ReplicaRouter']
+# Yozgandan keyin shuncha soniya user o'qishlari primary dan (read-your-writes)
+CHAT_READ_YOUR_WRITES_SECONDS = env.int('CHAT_READ_YOUR_WRITES_SECONDS', default=5)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -108,15 +122,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Bir processdagi group a'zolariga Redis siz yetkaziladi (chat.layers.HybridChannelLayer)
+CHAT_HYBRID_CHANNEL_LAYER = env.bool('CHAT_HYBRID_CHANNEL_LAYER', default=True)
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': (
+            'chat.layers.HybridChannelLayer' if CHAT_HYBRID_CHANNEL_LAYER
+            else 'channels_redis.core.RedisChannelLayer'
+        ),
         'CONFIG': {
             "hosts": [(env('REDIS_HOST'), int(env('REDIS_PORT')))],
         },
     },
 }
 
+REDIS_URL = f"redis://{env('REDIS_HOST')}:{env('REDIS_PORT')}"
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f"{REDIS_URL}/1",
+    },
+}
+
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
@@ -130,10 +159,76 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'chat.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 
 }
 
+# Chat history pagination
+CHAT_MESSAGES_PAGE_SIZE = env.int('CHAT_MESSAGES_PAGE_SIZE', default=50)
+CHAT_MESSAGES_MAX_PAGE_SIZE = env.int('CHAT_MESSAGES_MAX_PAGE_SIZE', default=200)
+NOTIFICATIONS_PAGE_SIZE = env.int('NOTIFICATIONS_PAGE_SIZE', default=50)
+NOTIFICATIONS_MAX_PAGE_SIZE = env.int('NOTIFICATIONS_MAX_PAGE_SIZE', default=200)
+ADMIN_INBOX_PAGE_SIZE = env.int('ADMIN_INBOX_PAGE_SIZE', default=50)
+ADMIN_INBOX_MAX_PAGE_SIZE = env.int('ADMIN_INBOX_MAX_PAGE_SIZE', default=200)
+SEARCH_PAGE_SIZE = env.int('SEARCH_PAGE_SIZE', default=20)
+SEARCH_MAX_PAGE_SIZE = env.int('SEARCH_MAX_PAGE_SIZE', default=100)
+USERS_PAGE_SIZE = env.int('USERS_PAGE_SIZE', default=20)
+USERS_MAX_PAGE_SIZE = env.int('USERS_MAX_PAGE_SIZE', default=100)
+# User directory sahifalari cache da; o'zgarishda versiya bilan tozalanadi, TTL replica lag uchun
+USER_DIRECTORY_CACHE_SECONDS = env.int('USER_DIRECTORY_CACHE_SECONDS', default=60)
+# Postgres text search konfiguratsiyasi (uz/ru/en aralash - stemming yo'q)
+CHAT_SEARCH_CONFIG = env('CHAT_SEARCH_CONFIG', default='simple')
+# WebSocket connect/reconnect da yuboriladigan messagelar soni
+CHAT_HISTORY_LIMIT = env.int('CHAT_HISTORY_LIMIT', default=50)
+# Connect replay uchun har bir chat ning oxirgi CHAT_HISTORY_LIMIT ta messagei process xotirasida
+CHAT_RECENT_CACHE_CHATS = env.int('CHAT_RECENT_CACHE_CHATS', default=10000)
+CHAT_RECENT_CACHE_BYTES = env.int('CHAT_RECENT_CACHE_BYTES', default=64 * 1024 * 1024)
+# Transcript export: cursor dan bir marta o'qiladigan qatorlar va yuboriladigan bo'lak hajmi
+CHAT_EXPORT_CHUNK_SIZE = env.int('CHAT_EXPORT_CHUNK_SIZE', default=2000)
+CHAT_EXPORT_BUFFER_BYTES = env.int('CHAT_EXPORT_BUFFER_BYTES', default=64 * 1024)
+
+# Consumer DB ishi uchun thread pool. Navbat CHAT_DB_EXECUTOR_MAX_QUEUE ga yetsa yangi connectlar rad etiladi
+CHAT_DB_EXECUTOR_WORKERS = env.int('CHAT_DB_EXECUTOR_WORKERS', default=10)
+CHAT_DB_EXECUTOR_MAX_QUEUE = env.int('CHAT_DB_EXECUTOR_MAX_QUEUE', default=200)
+CHAT_DB_CONN_MAX_AGE = env.int('CHAT_DB_CONN_MAX_AGE', default=300)
+
+# JSON backend: auto (orjson o'rnatilgan bo'lsa), orjson yoki json
+CHAT_JSON_BACKEND = env('CHAT_JSON_BACKEND', default='auto')
+
+# WebSocket yuborish navbati (har bir connection) va to'lganda: drop_oldest, coalesce yoki disconnect
+CHAT_OUTBOUND_QUEUE_SIZE = env.int('CHAT_OUTBOUND_QUEUE_SIZE', default=256)
+CHAT_OUTBOUND_OVERFLOW = env('CHAT_OUTBOUND_OVERFLOW', default='drop_oldest')
+# Kiruvchi messagelar limiti (message/soniya va burst). 0 - limit yo'q
+CHAT_INBOUND_USER_RATE = env.float('CHAT_INBOUND_USER_RATE', default=2.0)
+CHAT_INBOUND_USER_BURST = env.int('CHAT_INBOUND_USER_BURST', default=10)
+CHAT_INBOUND_CHAT_RATE = env.float('CHAT_INBOUND_CHAT_RATE', default=10.0)
+CHAT_INBOUND_CHAT_BURST = env.int('CHAT_INBOUND_CHAT_BURST', default=30)
+
+# Write-behind: messagelar darhol broadcast qilinadi, DB ga batch bilan yoziladi
+CHAT_WRITE_BEHIND = env.bool('CHAT_WRITE_BEHIND', default=False)
+CHAT_WRITE_BEHIND_MAX_QUEUE = env.int('CHAT_WRITE_BEHIND_MAX_QUEUE', default=10000)
+CHAT_WRITE_BEHIND_BATCH_SIZE = env.int('CHAT_WRITE_BEHIND_BATCH_SIZE', default=200)
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = env.float('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', default=0.05)
+
+# Eski messagelar archive jadvaliga ko'chiriladi (manage.py archive_messages)
+CHAT_ARCHIVE_AFTER_DAYS = env.int('CHAT_ARCHIVE_AFTER_DAYS', default=180)
+CHAT_ARCHIVE_BATCH_SIZE = env.int('CHAT_ARCHIVE_BATCH_SIZE', default=5000)
+
+# JWT principal cache (user id, username, user_type, is_active)
+PRINCIPAL_CACHE_SIZE = env.int('PRINCIPAL_CACHE_SIZE', default=10000)
+PRINCIPAL_CACHE_TTL = env.int('PRINCIPAL_CACHE_TTL', default=300)
+# Bir nechta worker process bo'lsa invalidation Redis pub/sub orqali tarqatiladi
+PRINCIPAL_CACHE_REDIS_INVALIDATION = env.bool('PRINCIPAL_CACHE_REDIS_INVALIDATION', default=False)
+# Redis uzilsa listener qayta ulanishlar orasidagi eng uzun kutish (sekund, 1s dan ikki baravar oshadi)
+PRINCIPAL_CACHE_LISTENER_BACKOFF = env.float('PRINCIPAL_CACHE_LISTENER_BACKOFF', default=30)
+
+# /metrics (Prometheus). Token berilsa `Authorization: Bearer <token>` talab qilinadi
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
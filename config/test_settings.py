@@ -0,0 +1,43 @@
+import os
+
+# Testlar uchun .env shart emas
+for key in ['DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'REDIS_HOST']:
+    os.environ.setdefault(key, '')
+os.environ.setdefault('DB_PORT', '5432')
+os.environ.setdefault('REDIS_PORT', '6379')
+
+from .settings import *  # noqa
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    },
+    # Replica routing testlari uchun alohida DB (replikatsiya yo'q, faqat routing tekshiriladi)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
+# Testlar odatda primary dan o'qiydi, replica faqat override_settings bilan yoqiladi
+CHAT_DB_REPLICAS = []
+
+# chat migratsiyalari `make mig` bilan yaratiladi, testda jadvallar modeldan quriladi
+MIGRATION_MODULES = {'chat': None}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# SQLite bir vaqtda bitta yozuvchi, shared-cache in-memory DB esa kutmasdan "table is locked" beradi
+CHAT_DB_EXECUTOR_WORKERS = 1